@@ -0,0 +1,158 @@
+"""
+Boot Time Benchmark
+
+Measures what a new worker pays before it can serve a request:
+
+  import_s         seconds to import the service package, from python -X importtime
+  create_app_s     seconds service.create_app() takes once the package is imported
+  first_request_s  seconds from starting gunicorn to the first 200 from /health
+
+Both are measured with CREATE_TABLES_ON_STARTUP on and off. Each number is
+the median of --runs runs. The slowest imports are listed so a regression
+points at its cause.
+
+Usage:
+
+    python benchmarks/boot.py              # print the results as JSON
+    python benchmarks/boot.py --save       # replace benchmarks/boot_baseline.json
+    python benchmarks/boot.py --check      # fail if slower than the baseline
+
+It uses DATABASE_URI, a SQLite file in a temporary directory by default.
+Compare against a baseline recorded on the same kind of machine.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "boot_baseline.json")
+
+
+# imports service, then prints the seconds create_app() takes
+BOOT_SCRIPT = """
+import time
+import service
+start = time.perf_counter()
+service.create_app()
+print(time.perf_counter() - start)
+"""
+
+
+def boot_time(env: dict) -> tuple:
+    """Returns the seconds to import service and to create the app, and the modules that took longest"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", BOOT_SCRIPT],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    total = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append((int(self_us), name.strip()))
+        if name == "service":
+            total = int(cumulative_us)
+    slowest = sorted(modules, reverse=True)[:10]
+    create_app_s = float(result.stdout.split()[-1])
+    return total / 1e6, create_app_s, {name: round(self_us / 1e6, 4) for self_us, name in slowest}
+
+
+def free_port() -> int:
+    """Returns a TCP port that nothing listens on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def first_request_time(env: dict, timeout: float = 30.0) -> float:
+    """Returns the seconds from starting gunicorn to the first 200 from /health"""
+    port = free_port()
+    env = dict(env, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS="1", GUNICORN_LOG_LEVEL="warning")
+    start = time.perf_counter()
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "service:create_app()"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+                connection.request("GET", "/health")
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError(f"gunicorn did not answer within {timeout} seconds")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def measure(runs: int) -> dict:
+    """Runs the benchmark and returns the results"""
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as directory:
+        env.setdefault("DATABASE_URI", f"sqlite:///{directory}/boot.db")
+        results = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "runs": runs,
+        }
+        for create_tables in ("true", "false"):
+            env["CREATE_TABLES_ON_STARTUP"] = create_tables
+            boots = [boot_time(env) for _ in range(runs)]
+            requests = [first_request_time(env) for _ in range(runs)]
+            results[f"create_tables_{create_tables}"] = {
+                "import_s": round(statistics.median(boot[0] for boot in boots), 4),
+                "create_app_s": round(statistics.median(boot[1] for boot in boots), 4),
+                "first_request_s": round(statistics.median(requests), 4),
+            }
+        results["slowest_imports_s"] = boots[-1][2]
+    return results
+
+
+def check(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a message for every measurement slower than the baseline allows"""
+    failures = []
+    for mode in ("create_tables_true", "create_tables_false"):
+        for metric, value in results[mode].items():
+            allowed = baseline[mode][metric] * (1 + tolerance)
+            if value > allowed:
+                failures.append(f"{mode} {metric}: {value}s is slower than {allowed:.4f}s")
+    return failures
+
+
+def main():
+    """Parses the arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 2)[1])
+    parser.add_argument("--runs", type=int, default=9, help="runs of each measurement")
+    parser.add_argument("--save", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="compare the results with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    results = measure(args.runs)
+    print(json.dumps(results, indent=2))
+    if args.save:
+        with open(BASELINE, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+    if args.check:
+        with open(BASELINE, encoding="utf-8") as file:
+            failures = check(results, json.load(file), args.tolerance)
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
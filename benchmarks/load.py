@@ -0,0 +1,401 @@
+"""
+HTTP Load Benchmark
+
+Seeds --customers Customers made by CustomerFactory, starts the service
+under gunicorn with gunicorn.conf.py, and has --clients threads send a
+mixed workload over keep-alive connections for --duration seconds. Every
+route in service/routes.py is in the mix (see WORKLOAD). Reads go to the
+seeded Customers, and each client writes only to Customers it created, so
+no request fails because of another client.
+
+It prints the throughput and the p50/p95/p99 latency of all requests and
+of each operation as JSON. Requests during the first --warmup seconds are
+sent but not counted.
+
+Usage:
+
+    python benchmarks/load.py                # print the results as JSON
+    python benchmarks/load.py --save         # replace benchmarks/load_baseline.json
+    python benchmarks/load.py --check        # fail if slower than the baseline
+
+It uses DATABASE_URI, a SQLite file in a temporary directory by default.
+Point it at a database of its own: it deletes every Customer before seeding.
+Compare against a baseline recorded on the same kind of machine with the
+same arguments.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import quote
+
+from boot import free_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "load_baseline.json")
+sys.path.insert(0, ROOT)
+
+NDJSON = "application/x-ndjson"
+
+# operation: share of the requests. Client.op_<operation> sends it.
+WORKLOAD = {
+    "get": 35,
+    "list": 12,
+    "list_filtered": 5,
+    "list_ndjson": 2,
+    "count": 3,
+    "count_head": 3,
+    "create": 10,
+    "update": 8,
+    "delete": 3,
+    "deactivate": 3,
+    "restore": 3,
+    "deactivate_bulk": 1,
+    "restore_bulk": 1,
+    "create_batch": 1,
+    "health": 6,
+    "index": 1,
+    "pool_stats": 1,
+    "metrics": 2,
+}
+OPERATIONS = list(WORKLOAD)
+WEIGHTS = list(WORKLOAD.values())
+
+
+def seed(database_uri: str, count: int) -> tuple:
+    """Replaces every Customer with count new ones, returns their ids and last names"""
+    # pylint: disable=import-outside-toplevel
+    from service import create_app
+    from service.models import Customer, db
+    from tests.factories import CustomerFactory
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": database_uri, "CREATE_TABLES_ON_STARTUP": True})
+    with app.app_context():
+        db.session.query(Customer).delete()
+        db.session.commit()
+        customers = CustomerFactory.build_batch(count)
+        for customer in customers:
+            customer.id = None
+        ids = Customer.create_many(customers, chunk_size=1000)
+        last_names = sorted({customer.last_name for customer in customers})
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    return ids, last_names
+
+
+def start_server(env: dict, timeout: float = 30.0):
+    """Starts gunicorn and waits until /health answers"""
+    server = subprocess.Popen(  # pylint: disable=consider-using-with
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "service:create_app()"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    host, port = env["GUNICORN_BIND"].split(":")
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, int(port), timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            time.sleep(0.05)
+    server.terminate()
+    raise RuntimeError(f"gunicorn did not answer within {timeout} seconds")
+
+
+class Client(threading.Thread):  # pylint: disable=too-many-instance-attributes,too-many-public-methods
+    """Sends random operations from the workload over one keep-alive connection"""
+
+    def __init__(self, address: tuple, seeded: dict, rng: random.Random, window: tuple):
+        super().__init__(daemon=True)
+        self.address = address
+        self.ids = seeded["ids"]
+        self.last_names = seeded["last_names"]
+        self.rng = rng
+        self.start_at, self.stop_at = window
+        self.created = []
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.connection = None
+
+    def request(self, method: str, path: str, body=None, headers=None):
+        """Sends one request and returns the status and the parsed body"""
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(*self.address, timeout=30)
+            try:
+                self.connection.request(method, path, body=data, headers=headers)
+                response = self.connection.getresponse()
+                content = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # the server closed the keep-alive connection, so try once more on a new one
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+        if response.getheader("Connection", "").lower() == "close":
+            self.connection.close()
+            self.connection = None
+        if content and response.getheader("Content-Type", "").startswith("application/json"):
+            return response.status, json.loads(content)
+        return response.status, None
+
+    def new_customer(self) -> dict:
+        """Returns the body of a new Customer"""
+        number = self.rng.randrange(10**9)
+        return {
+            "first_name": f"Load{number}",
+            "last_name": self.rng.choice(self.last_names),
+            "address": f"{number} Benchmark Road",
+            "active": True,
+        }
+
+    def own_id(self):
+        """Returns a Customer this client created, creating one if there is none"""
+        if not self.created:
+            self.op_create()
+        return self.rng.choice(self.created)
+
+    def op_get(self):
+        """Reads one Customer"""
+        return self.request("GET", f"/api/customers/{self.rng.choice(self.ids)}")[0]
+
+    def op_list(self):
+        """Reads the first page of Customers"""
+        return self.request("GET", "/api/customers?limit=20")[0]
+
+    def op_list_filtered(self):
+        """Reads the Customers with one last name"""
+        last_name = quote(self.rng.choice(self.last_names))
+        return self.request("GET", f"/api/customers?last_name={last_name}&limit=20")[0]
+
+    def op_list_ndjson(self):
+        """Streams a hundred Customers"""
+        return self.request("GET", "/api/customers?limit=100", headers={"Accept": NDJSON})[0]
+
+    def op_count(self):
+        """Counts the active Customers"""
+        return self.request("GET", "/api/customers/count?active=true")[0]
+
+    def op_count_head(self):
+        """Counts the Customers in a header"""
+        return self.request("HEAD", "/api/customers")[0]
+
+    def op_create(self):
+        """Creates a Customer"""
+        code, data = self.request("POST", "/api/customers", self.new_customer())
+        if code == 201:
+            self.created.append(int(data["id"]))
+        return code
+
+    def op_update(self):
+        """Replaces one of this client's Customers"""
+        return self.request("PUT", f"/api/customers/{self.own_id()}", self.new_customer())[0]
+
+    def op_delete(self):
+        """Deletes one of this client's Customers"""
+        customer_id = self.own_id()
+        self.created.remove(customer_id)
+        return self.request("DELETE", f"/api/customers/{customer_id}")[0]
+
+    def op_deactivate(self):
+        """Deactivates one of this client's Customers, then restores it unmeasured"""
+        customer_id = self.own_id()
+        code = self.request("PUT", f"/api/customers/{customer_id}/deactivate")[0]
+        self.request("PUT", f"/api/customers/{customer_id}/restore")
+        return code
+
+    def op_restore(self):
+        """Restores one of this client's Customers"""
+        return self.request("PUT", f"/api/customers/{self.own_id()}/restore")[0]
+
+    def op_deactivate_bulk(self):
+        """Deactivates five of this client's Customers, then restores them unmeasured"""
+        ids = [self.own_id() for _ in range(5)]
+        code = self.request("PUT", "/api/customers/deactivate", {"ids": ids})[0]
+        self.request("PUT", "/api/customers/restore", {"ids": ids})
+        return code
+
+    def op_restore_bulk(self):
+        """Restores five of this client's Customers"""
+        ids = [self.own_id() for _ in range(5)]
+        return self.request("PUT", "/api/customers/restore", {"ids": ids})[0]
+
+    def op_create_batch(self):
+        """Creates ten Customers in one request"""
+        code, data = self.request("POST", "/api/customers/batch", [self.new_customer() for _ in range(10)])
+        self.created.extend(int(result["id"]) for result in data or [] if "id" in result)
+        return code
+
+    def op_health(self):
+        """Checks the health"""
+        return self.request("GET", "/health")[0]
+
+    def op_index(self):
+        """Reads the home page"""
+        return self.request("GET", "/")[0]
+
+    def op_pool_stats(self):
+        """Reads the pool statistics"""
+        return self.request("GET", "/stats/pool")[0]
+
+    def op_metrics(self):
+        """Scrapes the metrics"""
+        return self.request("GET", "/metrics")[0]
+
+    def run(self):
+        while time.perf_counter() < self.stop_at:
+            name = self.rng.choices(OPERATIONS, WEIGHTS)[0]
+            start = time.perf_counter()
+            try:
+                code = getattr(self, f"op_{name}")()
+            except (http.client.HTTPException, OSError):
+                code = None
+            finish = time.perf_counter()
+            if start < self.start_at:
+                continue
+            if code is None or code >= 400:
+                self.errors[name] += 1
+            else:
+                self.latencies[name].append(finish - start)
+
+
+def percentiles(latencies: list) -> dict:
+    """Returns the p50, p95 and p99 of the latencies in milliseconds, by nearest rank"""
+    ordered = sorted(latencies)
+    if not ordered:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        f"p{point}_ms": round(ordered[max(math.ceil(point / 100 * len(ordered)) - 1, 0)] * 1000, 2)
+        for point in (50, 95, 99)
+    }
+
+
+def drive(address: tuple, seeded: dict, args) -> dict:
+    """Runs the clients against the server and returns the combined results"""
+    start_at = time.perf_counter() + args.warmup
+    window = (start_at, start_at + args.duration)
+    clients = [Client(address, seeded, random.Random(args.seed + number), window) for number in range(args.clients)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    for client in clients:
+        for name, values in client.latencies.items():
+            latencies[name].extend(values)
+        for name, count in client.errors.items():
+            errors[name] += count
+    every = [value for values in latencies.values() for value in values]
+    return {
+        "requests": len(every),
+        "errors": sum(errors.values()),
+        "throughput_rps": round(len(every) / args.duration, 1),
+        "latency": percentiles(every),
+        "operations": {
+            name: {"requests": len(latencies[name]), "errors": errors[name], **percentiles(latencies[name])}
+            for name in WORKLOAD
+        },
+    }
+
+
+def measure(args) -> dict:
+    """Seeds the database, starts gunicorn and runs the workload"""
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = os.getenv("DATABASE_URI", f"sqlite:///{directory}/load.db")
+        ids, last_names = seed(database_uri, args.customers)
+        port = free_port()
+        env = dict(
+            os.environ,
+            DATABASE_URI=database_uri,
+            CREATE_TABLES_ON_STARTUP="false",
+            GUNICORN_BIND=f"127.0.0.1:{port}",
+            GUNICORN_LOG_LEVEL="warning",
+        )
+        if args.workers:
+            env["GUNICORN_WORKERS"] = str(args.workers)
+        if args.threads:
+            env["GUNICORN_THREADS"] = str(args.threads)
+        server = start_server(env)
+        try:
+            results = drive(("127.0.0.1", port), {"ids": ids, "last_names": last_names}, args)
+        finally:
+            server.terminate()
+            server.wait()
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "database": database_uri.split(":", 1)[0],
+        "customers": args.customers,
+        "clients": args.clients,
+        "duration_s": args.duration,
+        "workers": args.workers or "gunicorn.conf.py",
+        "threads": args.threads or "gunicorn.conf.py",
+        **results,
+    }
+
+
+def check(results: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a message for every number worse than the baseline allows"""
+    failures = []
+    if results["errors"]:
+        failures.append(f"{results['errors']} requests failed")
+    allowed = baseline["throughput_rps"] * (1 - tolerance)
+    if results["throughput_rps"] < allowed:
+        failures.append(f"throughput: {results['throughput_rps']} req/s is below {allowed:.1f} req/s")
+    for metric, value in results["latency"].items():
+        allowed = baseline["latency"][metric] * (1 + tolerance)
+        if value > allowed:
+            failures.append(f"latency {metric}: {value} ms is slower than {allowed:.2f} ms")
+    return failures
+
+
+def main():
+    """Parses the arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 2)[1])
+    parser.add_argument("--customers", type=int, default=1000, help="Customers to seed")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="seconds to measure")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds before measuring")
+    parser.add_argument("--workers", type=int, help="gunicorn workers, sized by gunicorn.conf.py by default")
+    parser.add_argument("--threads", type=int, help="threads per worker, from gunicorn.conf.py by default")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the clients' random choices")
+    parser.add_argument("--save", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="compare the results with the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    results = measure(args)
+    print(json.dumps(results, indent=2))
+    if args.save:
+        with open(BASELINE, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+    if args.check:
+        with open(BASELINE, encoding="utf-8") as file:
+            failures = check(results, json.load(file), args.tolerance)
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
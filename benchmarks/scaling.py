@@ -0,0 +1,258 @@
+"""
+Model Scaling Benchmark
+
+Times the Customer model at several table sizes, with and without the
+indexes in Customer.__table_args__, and records the peak memory each
+operation allocates. The table grows from one size to the next with
+synthetic Customers, so the largest size is only inserted once.
+
+Every operation is timed --repeat times, and for at least half a second in
+all, with a new session each time. The best time is kept. The peak memory
+comes from one more run under tracemalloc. The growth column is the exponent k in time ~ n^k between the
+smallest and the largest size. k is near 0 for a lookup that an index
+serves, and near 1 for a full table scan or a full table load. A k that
+rises is the regression to look for.
+
+serialize and deserialize work on one Customer at a time. They are timed
+for 1000 Customers at every size, so their growth should stay near 0.
+
+Usage:
+
+    python benchmarks/scaling.py                            # 10k and 100k rows
+    python benchmarks/scaling.py --sizes 10000,100000,1000000,10000000
+    python benchmarks/scaling.py --save                     # replace benchmarks/scaling_baseline.json
+    python benchmarks/scaling.py --check                    # fail if it scales worse than the baseline
+
+It uses DATABASE_URI, a SQLite file in a temporary directory by default.
+Point it at a database of its own: it deletes every Customer before it
+starts. Customer.all loads the whole table, so budget about 1 GiB of
+memory per million rows for it.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, "benchmarks", "scaling_baseline.json")
+sys.path.insert(0, ROOT)
+
+# pylint: disable=wrong-import-position
+from faker import Faker  # noqa: E402
+from sqlalchemy import func, insert, select  # noqa: E402
+from service import create_app  # noqa: E402
+from service.models import Customer, db  # noqa: E402
+
+CHUNK_SIZE = 10000
+BATCH = 1000
+MIN_TIME = 0.5
+MAX_REPEAT = 1000
+
+
+class Data:
+    """Makes synthetic Customers from pools of names, so millions are cheap to make"""
+
+    def __init__(self, seed: int):
+        fake = Faker()
+        fake.seed_instance(seed)
+        self.rng = random.Random(seed)
+        self.first_names = [fake.first_name() for _ in range(500)]
+        self.last_names = [fake.last_name() for _ in range(1000)]
+        self.streets = [fake.street_name() for _ in range(1000)]
+        self.cities = [fake.city() for _ in range(500)]
+
+    def row(self, number: int) -> dict:
+        """Returns the columns of one Customer, with an address no other one has"""
+        return {
+            "first_name": self.rng.choice(self.first_names),
+            "last_name": self.rng.choice(self.last_names),
+            "address": f"{number} {self.rng.choice(self.streets)}, {self.rng.choice(self.cities)}",
+            "status": self.rng.random() < 0.9,
+        }
+
+
+def grow(data: Data, size: int):
+    """Inserts Customers until the table holds size of them"""
+    count = db.session.scalar(select(func.count()).select_from(Customer))  # pylint: disable=not-callable
+    while count < size:
+        rows = [data.row(number) for number in range(count, min(count + CHUNK_SIZE, size))]
+        db.session.execute(insert(Customer), rows)
+        db.session.commit()
+        count += len(rows)
+
+
+def set_indexes(indexed: bool):
+    """Creates or drops the indexes of the Customer table"""
+    if indexed:
+        Customer.create_indexes()
+        return
+    with db.engine.begin() as connection:
+        for index in Customer.__table__.indexes:
+            index.drop(connection, checkfirst=True)
+
+
+def operations(data: Data) -> dict:
+    """Returns the operations to time, each with a fresh target picked from the table"""
+    last_id = db.session.scalar(select(func.max(Customer.id)))  # pylint: disable=not-callable
+    target = db.session.get(Customer, data.rng.randint(1, last_id))
+    first_name, last_name, address, customer_id = target.first_name, target.last_name, target.address, target.id
+    customers = db.session.scalars(select(Customer).limit(BATCH)).all()
+    serialized = [customer.serialize() for customer in customers]
+    db.session.remove()
+    return {
+        "all": Customer.all,
+        "find": lambda: Customer.find(customer_id),
+        # the finders return a query, so fetch its rows
+        "find_by_name": lambda: Customer.find_by_name(first_name, last_name).all(),
+        "find_by_last_name": lambda: Customer.find_by_last_name(last_name).all(),
+        "find_by_address": lambda: Customer.find_by_address(address).all(),
+        "count": Customer.count,
+        "serialize": lambda: [customer.serialize() for customer in customers],
+        "deserialize": lambda: [Customer().deserialize(item) for item in serialized],
+    }
+
+
+def run(operation, repeat: int) -> dict:
+    """Returns the best time of the operation in ms and the peak memory it allocated in KiB"""
+    times = []
+    # fast operations run until they add up to MIN_TIME, so their best time is stable
+    while len(times) < repeat or (sum(times) < MIN_TIME and len(times) < MAX_REPEAT):
+        start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - start)
+        db.session.remove()
+    tracemalloc.start()
+    try:
+        operation()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        db.session.remove()
+    return {"ms": round(min(times) * 1000, 3), "peak_kib": round(peak / 1024, 1)}
+
+
+def growth(points: dict) -> float:
+    """Returns k in time ~ n^k between the smallest and the largest size"""
+    sizes = sorted(points, key=int)
+    if len(sizes) < 2:
+        return None
+    small, large = points[sizes[0]]["ms"], points[sizes[-1]]["ms"]
+    if small <= 0 or large <= 0:
+        return None
+    return round(math.log(large / small) / math.log(int(sizes[-1]) / int(sizes[0])), 2)
+
+
+def measure(args) -> dict:
+    """Grows the table through the sizes and times every operation at each one"""
+    with tempfile.TemporaryDirectory() as directory:
+        database_uri = os.getenv("DATABASE_URI", f"sqlite:///{directory}/scaling.db")
+        app = create_app({"SQLALCHEMY_DATABASE_URI": database_uri, "CREATE_TABLES_ON_STARTUP": True})
+        data = Data(args.seed)
+        results = {}
+        with app.app_context():
+            db.session.query(Customer).delete()
+            db.session.commit()
+            for size in args.sizes:
+                grow(data, size)
+                for indexed in (False, True):
+                    set_indexes(indexed)
+                    mode = "indexes" if indexed else "no_indexes"
+                    for name, operation in operations(data).items():
+                        point = run(operation, args.repeat)
+                        results.setdefault(name, {}).setdefault(mode, {})[str(size)] = point
+                        print(f"{size:>10,} {mode:<10} {name:<18} {point['ms']:>10.3f} ms", file=sys.stderr)
+            db.session.remove()
+            for engine in db.engines.values():
+                engine.dispose()
+    for modes in results.values():
+        for points in modes.values():
+            points["growth"] = growth({size: point for size, point in points.items() if size.isdigit()})
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "database": database_uri.split(":", 1)[0],
+        "sizes": args.sizes,
+        "operations": results,
+    }
+
+
+def table(results: dict) -> str:
+    """Returns the scaling table: time and peak memory at every size, and the growth"""
+    sizes = [str(size) for size in results["sizes"]]
+    header = f"{'operation':<18} {'indexes':<8}" + "".join(f"{int(size):>22,}" for size in sizes) + f"{'growth':>8}"
+    lines = [header, "-" * len(header)]
+    for name, modes in results["operations"].items():
+        for mode, points in modes.items():
+            cells = "".join(f"{points[size]['ms']:>9.2f} ms {points[size]['peak_kib']:>7.0f} KiB" for size in sizes)
+            k = points["growth"]
+            lines.append(
+                f"{name:<18} {'yes' if mode == 'indexes' else 'no':<8}{cells}{'n^' + str(k) if k is not None else '-':>8}"
+            )
+    return "\n".join(lines)
+
+
+def check(results: dict, baseline: dict, tolerance: float, slack: float, floor: float) -> list:
+    """Returns a message for every operation that scales or runs worse than the baseline allows
+
+    Times under floor ms vary too much from run to run to compare, so only
+    their growth is checked
+    """
+    failures = []
+    largest = str(max(size for size in results["sizes"] if size in baseline["sizes"]))
+    for name, modes in results["operations"].items():
+        for mode, points in modes.items():
+            expected = baseline["operations"].get(name, {}).get(mode)
+            if not expected:
+                continue
+            if points["growth"] is not None and expected["growth"] is not None \
+                    and points["growth"] > expected["growth"] + slack:
+                failures.append(f"{name} ({mode}) grows as n^{points['growth']}, was n^{expected['growth']}")
+            allowed = max(expected[largest]["ms"] * (1 + tolerance), floor)
+            if points[largest]["ms"] > allowed:
+                failures.append(
+                    f"{name} ({mode}) at {largest} rows: {points[largest]['ms']} ms is slower than {allowed:.3f} ms"
+                )
+    return failures
+
+
+def main():
+    """Parses the arguments and runs the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 2)[1])
+    parser.add_argument("--sizes", default="10000,100000", help="table sizes, separated by commas")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs of each operation")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the synthetic data")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON instead of a table")
+    parser.add_argument("--save", action="store_true", help="save the results as the baseline")
+    parser.add_argument("--check", action="store_true", help="compare the results with the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="allowed slowdown at the largest size, 1.0 is 100%%")
+    parser.add_argument("--slack", type=float, default=0.25, help="allowed rise of the growth exponent")
+    parser.add_argument("--floor", type=float, default=5.0, help="ms under which a time is never a slowdown")
+    args = parser.parse_args()
+    args.sizes = sorted(int(size) for size in args.sizes.split(","))
+    if args.check:
+        with open(BASELINE, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if not set(args.sizes) & set(baseline["sizes"]):
+            parser.error(f"--check needs --sizes to share a size with the baseline, {baseline['sizes']}")
+
+    results = measure(args)
+    print(json.dumps(results, indent=2) if args.json else table(results))
+    if args.save:
+        with open(BASELINE, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+    if args.check:
+        failures = check(results, baseline, args.tolerance, args.slack, args.floor)
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,47 +6,50 @@ and SQL database
 """
 import sys
 from flask import Flask
-from flask_restx import Api
-from service import config
-from service.common import log_handlers
-
-# Create Flask application
-app = Flask(__name__)
-app.config.from_object(config)
-
-######################################################################
-# Configure Swagger before initializing it
-######################################################################
-api = Api(
-    app,
-    version="1.0.0",
-    title="Customer Demo REST API Service",
-    description="This is a sample customer server.",
-    default="customers",
-    default_label="Customer operations",
-    doc="/apidocs",
-    prefix="/api",
-)
-
-# Dependencies require we import the routes AFTER the Flask app is created
-# pylint: disable=wrong-import-position, wrong-import-order, cyclic-import
-from service import routes, models  # noqa: E402, E261
-
-# pylint: disable=wrong-import-position
-from service.common import error_handlers, cli_commands  # noqa: F401, E402
-
-# Set up logging for production
-log_handlers.init_logging(app, "gunicorn.error")
-
-app.logger.info(70 * "*")
-app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
-app.logger.info(70 * "*")
-
-try:
-    models.init_db(app)  # make our SQLAlchemy tables
-except Exception as error:  # pylint: disable=broad-except
-    app.logger.critical("%s: Cannot continue", error)
-    # gunicorn requires exit code 4 to stop spawning workers when they die
-    sys.exit(4)
-
-app.logger.info("Service initialized!")
+from service import config, models, routes
+from service.common import cli_commands, error_handlers, log_handlers, json_provider, metrics, profiler, query_stats
+
+
+def create_app(test_config: dict = None) -> Flask:
+    """Creates and configures the Flask application
+
+    The configuration and request hooks belong to each application, but
+    routes.api, models.db and Customer.cache are module globals: the last
+    application created is the one they serve, so build one per process.
+    Under gunicorn --preload that one is built in the arbiter, and every
+    forked worker replaces the connections and cache it inherits.
+
+    Args:
+        test_config (dict): settings that replace the ones from service.config
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    if test_config:
+        app.config.update(test_config)
+    app.json = json_provider.FastJSONProvider(app)
+    # first, so the profile covers the other hooks too
+    profiler.init_app(app)
+    metrics.init_app(app)
+    query_stats.init_app(app)
+
+    routes.api.init_app(app)
+    app.register_blueprint(routes.blueprint)
+    app.register_blueprint(error_handlers.blueprint)
+    app.register_blueprint(cli_commands.blueprint)
+
+    # Set up logging for production
+    log_handlers.init_logging(app, "gunicorn.error")
+
+    app.logger.info(70 * "*")
+    app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
+    app.logger.info(70 * "*")
+
+    try:
+        models.init_db(app)  # make our SQLAlchemy tables
+    except Exception as error:  # pylint: disable=broad-except
+        app.logger.critical("%s: Cannot continue", error)
+        # gunicorn requires exit code 4 to stop spawning workers when they die
+        sys.exit(4)
+
+    app.logger.info("Service initialized!")
+    return app
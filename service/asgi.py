@@ -0,0 +1,354 @@
+"""
+ASGI Service
+
+An asyncio entry point that serves the same /api/customers contract as the
+Flask service. Queries go through the SQLAlchemy asyncio extension with an
+async driver (asyncpg for PostgreSQL, aiosqlite for SQLite), so a request
+that waits on the database gives up the event loop instead of a worker.
+One process can then hold hundreds of requests in flight, limited by
+ASYNC_POOL_SIZE + ASYNC_MAX_OVERFLOW connections rather than by threads.
+
+It reuses the Customer table, validation and serialization, and runs with:
+
+    uvicorn --factory service.asgi:create_application --host 0.0.0.0 --port 8080
+
+The application is only built when the server calls the factory, so
+importing this module never connects to the database.
+
+The batch and bulk status endpoints and the NDJSON stream are only served
+by the Flask service.
+"""
+import json
+import logging
+import re
+from urllib.parse import parse_qs, urlencode
+from flask_restx import inputs
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_etags, quote_etag
+from service import create_app
+from service.common import status  # HTTP Status Codes
+from service.common.error_handlers import error_body
+from service.common.json_provider import COMPACT
+from service.models import Customer, DataValidationError
+from service.routes import decode_cursor, encode_cursor, etag_for, field_list
+
+logger = logging.getLogger("flask.app")
+
+# The async driver for each synchronous URI scheme
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+FILTERS = {"first_name": str, "last_name": str, "address": str, "active": inputs.boolean}
+
+
+def async_uri(uri: str) -> str:
+    """Returns the database URI with the async driver for its database"""
+    scheme, separator, rest = uri.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+
+class HTTPError(Exception):
+    """Used to end a request with an error status"""
+
+    def __init__(self, code: int, message: str, errors: dict = None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.errors = errors
+
+
+class Request:
+    """The parts of an ASGI HTTP request that the handlers use"""
+
+    def __init__(self, scope: dict, body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.scheme = scope.get("scheme", "http")
+        self.headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        self.args = {name: values[-1] for name, values in parse_qs(scope["query_string"].decode()).items()}
+        self.body = body
+
+    def json(self):
+        """Returns the body parsed as JSON"""
+        try:
+            return json.loads(self.body)
+        except ValueError as error:
+            raise HTTPError(status.HTTP_400_BAD_REQUEST, f"The body is not valid JSON: {error}") from error
+
+    def etags(self, name: str):
+        """Returns the entity tags in the If-Match or If-None-Match header"""
+        return parse_etags(self.headers.get(name))
+
+    def url(self, params: dict) -> str:
+        """Returns the absolute URL of this path with the query parameters"""
+        host = self.headers.get("host", "localhost")
+        return f"{self.scheme}://{host}{self.path}?{urlencode(params)}"
+
+
+class CustomerApp:
+    """ASGI application for the Customer REST API"""
+
+    def __init__(self, app):
+        self.config = config = app.config
+        self.json = app.json
+        options = {
+            "pool_pre_ping": config["SQLALCHEMY_ENGINE_OPTIONS"].get("pool_pre_ping", True),
+            "pool_recycle": config["SQLALCHEMY_ENGINE_OPTIONS"].get("pool_recycle", -1),
+        }
+        uri = async_uri(config["SQLALCHEMY_DATABASE_URI"])
+        # aiosqlite connections aren't pooled, every session opens its own
+        if not uri.startswith("sqlite"):
+            options.update(
+                pool_size=config["ASYNC_POOL_SIZE"],
+                max_overflow=config["ASYNC_MAX_OVERFLOW"],
+                pool_timeout=config["DB_POOL_TIMEOUT"],
+            )
+        self.engine = create_async_engine(uri, **options)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.routes = [
+            (re.compile(r"/health"), {"GET": self.health}),
+            (re.compile(r"/api/customers/?"), {
+                "GET": self.list_customers, "HEAD": self.head_customers, "POST": self.create_customer,
+            }),
+            (re.compile(r"/api/customers/count/?"), {"GET": self.count_customers}),
+            (re.compile(r"/api/customers/(?P<customer_id>\d+)/?"), {
+                "GET": self.get_customer, "PUT": self.update_customer, "DELETE": self.delete_customer,
+            }),
+            (re.compile(r"/api/customers/(?P<customer_id>\d+)/deactivate/?"), {"PUT": self.deactivate_customer}),
+            (re.compile(r"/api/customers/(?P<customer_id>\d+)/restore/?"), {"PUT": self.restore_customer}),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":  # pragma: no cover
+            return
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        request = Request(scope, body)
+        try:
+            code, data, headers = await self.dispatch(request)
+        except HTTPError as error:
+            code, data, headers = error.code, error_body(error.code, error.message, error.errors), {}
+        except HTTPException as error:
+            # raised by the helpers shared with the Flask routes
+            code, data, headers = error.code, error_body(error.code, error.description), {}
+        except DataValidationError as error:
+            logger.warning(str(error))
+            code, data, headers = status.HTTP_400_BAD_REQUEST, error_body(status.HTTP_400_BAD_REQUEST, str(error)), {}
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Exception on %s [%s]", request.path, request.method)
+            code, headers = status.HTTP_500_INTERNAL_SERVER_ERROR, {}
+            data = error_body(code, "Internal Server Error")
+        await self.respond(send, request, code, data, headers)
+
+    async def lifespan(self, receive, send):
+        """Closes the database connections when the server shuts down"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def dispatch(self, request: Request) -> tuple:
+        """Calls the handler for the path and method, returns (status, data, headers)"""
+        for pattern, handlers in self.routes:
+            match = pattern.fullmatch(request.path)
+            if match is None:
+                continue
+            handler = handlers.get(request.method)
+            if handler is None:
+                raise HTTPError(status.HTTP_405_METHOD_NOT_ALLOWED, "The method is not allowed for the requested URL.")
+            params = {name: int(value) for name, value in match.groupdict().items()}
+            return await handler(request, **params)
+        raise HTTPError(status.HTTP_404_NOT_FOUND, "The requested URL was not found on the server.")
+
+    async def respond(self, send, request: Request, code: int, data, headers: dict):  # pylint: disable=too-many-arguments
+        """Sends the data as a JSON response"""
+        body = b""
+        if data is not None and code != status.HTTP_304_NOT_MODIFIED:
+            body = (self.json.dumps(data, separators=COMPACT) + "\n").encode("utf-8")
+            headers = {"Content-Type": "application/json", **headers}
+        headers["Content-Length"] = str(len(body))
+        await send({
+            "type": "http.response.start",
+            "status": code,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        })
+        await send({"type": "http.response.body", "body": b"" if request.method == "HEAD" else body})
+
+    ######################################################################
+    #  H A N D L E R S
+    ######################################################################
+    async def health(self, request: Request) -> tuple:  # pylint: disable=unused-argument
+        """Health Status"""
+        return status.HTTP_200_OK, {"status": "OK"}, {}
+
+    async def get_customer(self, request: Request, customer_id: int) -> tuple:
+        """Returns a single Customer, or 304 when it matches If-None-Match"""
+        names = parse_args(request, {"fields": field_list})["fields"]
+        data = Customer.cache.get(customer_id)  # pylint: disable=assignment-from-none
+        if data is None:
+            async with self.sessions() as session:
+                customer = await session.get(Customer, customer_id)
+            if customer is not None:
+                data = customer.serialize()
+                Customer.cache.set(customer_id, data)
+        if not data or not data["active"]:
+            raise HTTPError(status.HTTP_404_NOT_FOUND, f"Customer with id '{customer_id}' was not found.")
+        if names:
+            data = {name: data[name] for name in names}
+        etag = etag_for(data)
+        if request.etags("if-none-match").contains_weak(etag):
+            return status.HTTP_304_NOT_MODIFIED, None, {"ETag": quote_etag(etag)}
+        return status.HTTP_200_OK, wire(data), {"ETag": quote_etag(etag)}
+
+    async def update_customer(self, request: Request, customer_id: int) -> tuple:
+        """Updates a Customer from the body, unless it changed since If-Match"""
+        async with self.sessions() as session:
+            # locked, so no other update can land between the If-Match check and the commit
+            customer = await session.get(Customer, customer_id, with_for_update=True, populate_existing=True)
+            if not customer or not customer.status:
+                raise HTTPError(status.HTTP_404_NOT_FOUND, f"Customer with id '{customer_id}' was not found.")
+            if_match = request.etags("if-match")
+            if if_match and not if_match.contains(etag_for(customer.serialize())):
+                raise HTTPError(
+                    status.HTTP_412_PRECONDITION_FAILED,
+                    f"Customer with id '{customer_id}' has been changed by someone else.",
+                )
+            customer.deserialize(request.json())
+            if not customer.status:
+                raise HTTPError(status.HTTP_400_BAD_REQUEST, "Cannot update the status.")
+            await session.commit()
+        Customer.cache.delete(customer_id)
+        data = customer.serialize()
+        return status.HTTP_200_OK, wire(data), {"ETag": quote_etag(etag_for(data))}
+
+    async def delete_customer(self, request: Request, customer_id: int) -> tuple:  # pylint: disable=unused-argument
+        """Deletes a Customer"""
+        async with self.sessions() as session:
+            customer = await session.get(Customer, customer_id)
+            if customer:
+                await session.delete(customer)
+                await session.commit()
+        Customer.cache.delete(customer_id)
+        return status.HTTP_204_NO_CONTENT, None, {}
+
+    async def deactivate_customer(self, request: Request, customer_id: int) -> tuple:  # pylint: disable=unused-argument
+        """Deactivates a Customer"""
+        await self._set_status(customer_id, False)
+        return status.HTTP_200_OK, "", {}
+
+    async def restore_customer(self, request: Request, customer_id: int) -> tuple:  # pylint: disable=unused-argument
+        """Restores a deactivated Customer"""
+        customer = await self._set_status(customer_id, True)
+        return status.HTTP_200_OK, wire(customer.serialize()), {}
+
+    async def _set_status(self, customer_id: int, active: bool) -> Customer:
+        """Sets the status of a Customer"""
+        async with self.sessions() as session:
+            customer = await session.get(Customer, customer_id)
+            if not customer:
+                raise HTTPError(status.HTTP_404_NOT_FOUND, f"Customer with id '{customer_id}' was not found.")
+            if active:
+                customer.restore()
+            else:
+                customer.deactivate()
+            await session.commit()
+        Customer.cache.delete(customer_id)
+        return customer
+
+    async def list_customers(self, request: Request) -> tuple:
+        """Returns one page of the Customers with a Link to the next one"""
+        args = parse_args(request, dict(FILTERS, fields=field_list, limit=inputs.positive))
+        names = args["fields"] or list(Customer.FIELDS)
+        filters = {name: args[name] for name in FILTERS if args[name] is not None}
+        after_id = decode_cursor(request.args["cursor"]) if "cursor" in request.args else None
+        limit = min(args["limit"] or self.config["DEFAULT_PAGE_SIZE"], self.config["MAX_PAGE_SIZE"])
+        statement = Customer.rows_statement(names, after_id, **filters).limit(limit)
+        async with self.sessions() as session:
+            rows = (await session.execute(statement)).all()
+        results = [dict(zip(names, row)) for row in rows]
+        etag = etag_for(results)
+        if request.etags("if-none-match").contains_weak(etag):
+            return status.HTTP_304_NOT_MODIFIED, None, {"ETag": quote_etag(etag)}
+        headers = {"ETag": quote_etag(etag)}
+        if len(rows) == limit:
+            params = dict(request.args, cursor=encode_cursor(rows[-1][-1]), limit=limit)
+            headers["Link"] = f'<{request.url(params)}>; rel="next"'
+        return status.HTTP_200_OK, results, headers
+
+    async def head_customers(self, request: Request) -> tuple:
+        """Returns the number of matching Customers in the X-Total-Count header"""
+        count, estimated = await self._count(request)
+        headers = {"X-Total-Count": str(count)}
+        if estimated:
+            headers["X-Total-Count-Estimated"] = "true"
+        return status.HTTP_200_OK, None, headers
+
+    async def count_customers(self, request: Request) -> tuple:
+        """Returns the number of matching Customers"""
+        count, estimated = await self._count(request)
+        return status.HTTP_200_OK, {"count": count, "estimated": estimated}, {}
+
+    async def _count(self, request: Request) -> tuple:
+        """Counts the Customers selected by the filters, returns (count, estimated)"""
+        args = parse_args(request, dict(FILTERS, estimate=inputs.boolean))
+        filters = {name: args[name] for name in FILTERS if args[name] is not None}
+        async with self.sessions() as session:
+            if args["estimate"] and not filters and self.engine.dialect.name == "postgresql":
+                estimate = (await session.execute(Customer.estimate_statement())).scalar()
+                if estimate is not None and estimate >= 0:
+                    return estimate, True
+            return (await session.execute(Customer.count_statement(**filters))).scalar_one(), False
+
+    async def create_customer(self, request: Request) -> tuple:
+        """Creates a Customer from the body"""
+        customer = Customer().deserialize(request.json())
+        customer.id = None
+        async with self.sessions() as session:
+            session.add(customer)
+            await session.commit()
+        Customer.cache.delete(customer.id)
+        location = f"{request.scheme}://{request.headers.get('host', 'localhost')}/api/customers/{customer.id}"
+        return status.HTTP_201_CREATED, wire(customer.serialize()), {"Location": location}
+
+
+def wire(data: dict) -> dict:
+    """Returns the serialized Customer with its id as a string, like the REST API sends it"""
+    if "id" in data:
+        return dict(data, id=str(data["id"]))
+    return data
+
+
+def parse_args(request: Request, types: dict) -> dict:
+    """Converts the query string arguments, a missing one is None"""
+    args = {}
+    errors = {}
+    for name, convert in types.items():
+        value = request.args.get(name)
+        try:
+            args[name] = None if value is None else convert(value)
+        except ValueError as error:
+            errors[name] = str(error)
+    if errors:
+        raise HTTPError(status.HTTP_400_BAD_REQUEST, "Input payload validation failed", errors)
+    return args
+
+
+def create_application() -> CustomerApp:
+    """Creates the ASGI application from a Flask one, to share its settings, cache and JSON encoder"""
+    return CustomerApp(create_app())
@@ -0,0 +1,124 @@
+"""
+Bulk Loading
+
+This module streams Customers from files into the database for flask
+db-load. The readers turn CSV and NDJSON files into records one line at a
+time, and CopyStream turns rows back into the CSV that PostgreSQL's COPY
+FROM STDIN reads. Nothing here holds more than one chunk of rows, so a file
+of any size loads in constant memory.
+"""
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+TRUE = {"true", "t", "yes", "y", "1"}
+FALSE = {"false", "f", "no", "n", "0"}
+
+# the characters COPY reads from a CopyStream at a time
+COPY_BUFFER_SIZE = 65536
+
+
+class LoadError(Exception):
+    """Used when a line of the input cannot be read"""
+
+
+def parse_bool(value: str):
+    """Returns the boolean a CSV cell spells, or the cell itself if it spells none"""
+    text = value.strip().lower()
+    if text in TRUE:
+        return True
+    if text in FALSE:
+        return False
+    return value
+
+
+def read_csv(file):
+    """Yields (line number, record) for every row of a CSV file with a header row
+
+    The active column is turned into a boolean, so the records deserialize
+    like the JSON the API accepts
+    """
+    reader = csv.DictReader(file)
+    for record in reader:
+        if "active" in record and isinstance(record["active"], str):
+            record["active"] = parse_bool(record["active"])
+        yield reader.line_num, record
+
+
+def read_ndjson(file):
+    """Yields (line number, record) for every non-blank line of a newline delimited JSON file"""
+    for number, line in enumerate(file, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as error:
+            raise LoadError(f"line {number}: {error}") from error
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def chunks(rows, size: int):
+    """Yields lists of up to size rows, reading only one of them at a time"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class CopyStream(io.TextIOBase):
+    """A file that reads rows as the CSV of COPY ... FROM STDIN WITH (FORMAT csv)
+
+    Every read() turns just enough rows into text, so the rows can come
+    from a generator of any length. COPY reads an unquoted empty field as
+    NULL, so every value but NULL is quoted and an empty string stays one,
+    as it does with executemany.
+    """
+
+    def __init__(self, rows, columns: list):
+        super().__init__()
+        self.rows = iter(rows)
+        self.columns = columns
+        self.count = 0
+        self._pending = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> str:
+        """Returns the CSV of the next rows, about size characters, or "" at the end"""
+        while size < 0 or len(self._pending) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self._pending += ",".join(self.cell(row[column]) for column in self.columns) + "\n"
+            self.count += 1
+        if size < 0:
+            size = len(self._pending)
+        text, self._pending = self._pending[:size], self._pending[size:]
+        return text
+
+    @staticmethod
+    def cell(value) -> str:
+        """Returns a value the way COPY reads it in CSV: empty for NULL, t or f for a boolean, else quoted"""
+        if value is None:
+            return ""
+        if isinstance(value, bool):
+            return "t" if value else "f"
+        return '"' + str(value).replace('"', '""') + '"'
+
+
+def progress(rows, every: int, report):
+    """Yields the rows and calls report(rows so far, seconds so far) every so many of them"""
+    start = time.perf_counter()
+    count = 0
+    for row in rows:
+        yield row
+        count += 1
+        if count % every == 0:
+            report(count, time.perf_counter() - start)
@@ -0,0 +1,124 @@
+"""
+Cache Backends
+
+This module contains the caches used to avoid a database round trip on
+reads. NullCache, the default, turns caching off. The in-process LRUCache
+is only correct when one worker serves every request, because a write only
+clears the cache of the worker that made it. Any class that implements
+CacheBackend can be named in CUSTOMER_CACHE_BACKEND, for example one that
+shares its entries between gunicorn workers.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from importlib import import_module
+
+
+class CacheBackend(ABC):
+    """Interface that every cache backend implements"""
+
+    @classmethod
+    def from_config(cls, config):  # pylint: disable=unused-argument
+        """Creates the backend from the application configuration"""
+        return cls()
+
+    @abstractmethod
+    def get(self, key):
+        """Returns the value stored under key, or None when it is not cached"""
+
+    @abstractmethod
+    def set(self, key, value):
+        """Stores value under key"""
+
+    @abstractmethod
+    def delete(self, key):
+        """Removes key so the next get() is a miss"""
+
+    @abstractmethod
+    def clear(self):
+        """Removes every key"""
+
+    def stats(self) -> dict:
+        """Returns the state of the cache for GET /stats/cache; hits and misses are Prometheus counters"""
+        return {}
+
+
+class NullCache(CacheBackend):
+    """A cache that never stores anything, used to turn caching off"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class LRUCache(CacheBackend):
+    """
+    A bounded in-process cache
+
+    Entries expire ttl seconds after they are set, and the least recently
+    used entry is evicted when more than maxsize entries are stored
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config["CUSTOMER_CACHE_SIZE"], config["CUSTOMER_CACHE_TTL"])
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "evictions": self.evictions,
+            }
+
+
+def create_cache(config) -> CacheBackend:
+    """Creates the backend named by CUSTOMER_CACHE_BACKEND, a dotted class path"""
+    module_name, class_name = config["CUSTOMER_CACHE_BACKEND"].rsplit(".", 1)
+    backend = getattr(import_module(module_name), class_name)
+    return backend.from_config(config)
@@ -16,101 +16,88 @@
 
 """
 Module: error_handlers
+
+Every error response has the same body, {status, error, message}, whether
+it comes from the Flask app, from a REST API resource or from service.asgi.
 """
-from flask import jsonify
+from http import HTTPStatus
+from flask import Blueprint, current_app, jsonify
 from service.models import DataValidationError
-from service import app
 from . import status
 
+blueprint = Blueprint("error_handlers", __name__)
+
+# clients may match on these, so they keep the text they had before the HTTP reason phrases
+ERROR_TEXT = {
+    status.HTTP_405_METHOD_NOT_ALLOWED: "Method not Allowed",
+    status.HTTP_415_UNSUPPORTED_MEDIA_TYPE: "Unsupported media type",
+}
+
+
+def error_body(code: int, message: str, errors: dict = None) -> dict:
+    """Returns the body of an error response, with the invalid fields if there are any"""
+    body = {"status": code, "error": ERROR_TEXT.get(code, HTTPStatus(code).phrase), "message": message}
+    if errors:
+        body["errors"] = errors
+    return body
+
+
+def error_response(code: int, error):
+    """Logs the error and returns its response"""
+    message = str(error)
+    if code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+        current_app.logger.error(message)
+    else:
+        current_app.logger.warning(message)
+    return jsonify(error_body(code, message)), code
+
 
 ######################################################################
 # Error Handlers
 ######################################################################
-@app.errorhandler(DataValidationError)
+@blueprint.app_errorhandler(DataValidationError)
 def request_validation_error(error):
     """Handles Value Errors from bad data"""
     return bad_request(error)
 
 
-@app.errorhandler(status.HTTP_400_BAD_REQUEST)
+@blueprint.app_errorhandler(status.HTTP_400_BAD_REQUEST)
 def bad_request(error):
     """Handles bad requests with 400_BAD_REQUEST"""
-    message = str(error)
-    app.logger.warning(message)
-    return (
-        jsonify(
-            status=status.HTTP_400_BAD_REQUEST, error="Bad Request", message=message
-        ),
-        status.HTTP_400_BAD_REQUEST,
-    )
+    return error_response(status.HTTP_400_BAD_REQUEST, error)
 
 
-@app.errorhandler(status.HTTP_404_NOT_FOUND)
+@blueprint.app_errorhandler(status.HTTP_404_NOT_FOUND)
 def not_found(error):
     """Handles resources not found with 404_NOT_FOUND"""
-    message = str(error)
-    app.logger.warning(message)
-    return (
-        jsonify(status=status.HTTP_404_NOT_FOUND, error="Not Found", message=message),
-        status.HTTP_404_NOT_FOUND,
-    )
+    return error_response(status.HTTP_404_NOT_FOUND, error)
 
 
-@app.errorhandler(status.HTTP_405_METHOD_NOT_ALLOWED)
+@blueprint.app_errorhandler(status.HTTP_405_METHOD_NOT_ALLOWED)
 def method_not_supported(error):
     """Handles unsupported HTTP methods with 405_METHOD_NOT_SUPPORTED"""
-    message = str(error)
-    app.logger.warning(message)
-    return (
-        jsonify(
-            status=status.HTTP_405_METHOD_NOT_ALLOWED,
-            error="Method not Allowed",
-            message=message,
-        ),
-        status.HTTP_405_METHOD_NOT_ALLOWED,
-    )
-
-
-@app.errorhandler(status.HTTP_409_CONFLICT)
+    return error_response(status.HTTP_405_METHOD_NOT_ALLOWED, error)
+
+
+@blueprint.app_errorhandler(status.HTTP_409_CONFLICT)
 def resource_conflict(error):
     """Handles resource conflicts with HTTP_409_CONFLICT"""
-    message = str(error)
-    app.logger.warning(message)
-    return (
-        jsonify(
-            status=status.HTTP_409_CONFLICT,
-            error="Conflict",
-            message=message,
-        ),
-        status.HTTP_409_CONFLICT,
-    )
-
-
-@app.errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    return error_response(status.HTTP_409_CONFLICT, error)
+
+
+@blueprint.app_errorhandler(status.HTTP_412_PRECONDITION_FAILED)
+def precondition_failed(error):
+    """Handles failed conditional requests with HTTP_412_PRECONDITION_FAILED"""
+    return error_response(status.HTTP_412_PRECONDITION_FAILED, error)
+
+
+@blueprint.app_errorhandler(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
 def mediatype_not_supported(error):
     """Handles unsupported media requests with 415_UNSUPPORTED_MEDIA_TYPE"""
-    message = str(error)
-    app.logger.warning(message)
-    return (
-        jsonify(
-            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-            error="Unsupported media type",
-            message=message,
-        ),
-        status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-    )
-
-
-@app.errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return error_response(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, error)
+
+
+@blueprint.app_errorhandler(status.HTTP_500_INTERNAL_SERVER_ERROR)
 def internal_server_error(error):
     """Handles unexpected server error with 500_SERVER_ERROR"""
-    message = str(error)
-    app.logger.error(message)
-    return (
-        jsonify(
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            error="Internal Server Error",
-            message=message,
-        ),
-        status.HTTP_500_INTERNAL_SERVER_ERROR,
-    )
+    return error_response(status.HTTP_500_INTERNAL_SERVER_ERROR, error)
@@ -0,0 +1,65 @@
+"""
+JSON Provider
+
+This module contains a Flask JSON provider that encodes with orjson when it
+is installed and JSON_ENCODER allows it. The output is byte for byte what
+the standard library provider would produce, so anything orjson would write
+differently is handed back to the standard library. The one exception is a
+NaN or infinite float, which is not valid JSON and comes out as null.
+"""
+import re
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+COMPACT = (",", ":")
+
+# orjson writes 1e16 and 1e-7 where the standard library writes 1e+16 and 1e-07.
+# A string can hold the same characters, which only costs a fallback.
+EXPONENT = re.compile(rb"[0-9]e-?[0-9]")
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that prefers orjson for compact output"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        encoder = app.config.get("JSON_ENCODER", "auto")
+        if encoder not in ("auto", "orjson", "json"):
+            raise ValueError(f"JSON_ENCODER must be auto, orjson or json, not {encoder}")
+        if encoder == "orjson" and orjson is None:
+            raise RuntimeError("JSON_ENCODER is orjson but orjson is not installed")
+        self.use_orjson = orjson is not None and encoder != "json"
+
+    def dumps(self, obj, **kwargs) -> str:
+        """Serializes obj to a JSON string, with orjson when the output matches"""
+        if self.use_orjson and kwargs == {"separators": COMPACT}:
+            option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            try:
+                data = orjson.dumps(obj, default=self.default, option=option)
+            except orjson.JSONEncodeError:
+                data = None
+            # orjson writes non-ASCII characters as UTF-8 instead of escaping them
+            if data is not None and (data.isascii() or not self.ensure_ascii) and not EXPONENT.search(data):
+                return data.decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+
+def compact_dumps(obj) -> str:
+    """Serializes obj to compact JSON with the current application's provider"""
+    return current_app.json.dumps(obj, separators=COMPACT)
+
+
+def output_json(data, code, headers=None):
+    """Makes a flask-restx response with the application's JSON provider"""
+    response = current_app.response_class(
+        compact_dumps(data) + "\n", status=code, mimetype="application/json"
+    )
+    response.headers.extend(headers or {})
+    return response
@@ -19,18 +19,248 @@ Log Handlers
 
 This module contains utility functions to set up logging
 consistently
+
+With LOG_QUEUE_SIZE above 0 the request thread only puts each record on a
+bounded queue, and a listener thread formats and writes it. The process has
+one such pipeline for its handlers, whichever app asks for it. When the queue
+is full the record is dropped and counted, so a slow disk or a blocked
+stdout never holds up a request. LOG_FORMAT=json writes one JSON object per
+line. Every record carries the id of its request, taken from the
+X-Request-ID header or made up, and sent back in the response.
+LOG_SAMPLE_RATES keeps only a share of the INFO and DEBUG records of the
+loggers it names.
 """
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import random
+import re
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import has_request_context, request
+from service.common import metrics
+
+# the logger the service modules write to; Flask 2.3 names app.logger after the app instead
+MODULE_LOGGER = "flask.app"
+REQUEST_ID_HEADER = "X-Request-ID"
+ENVIRON_KEY = "service.request_id"
+TEXT_FORMAT = "[%(asctime)s] [%(levelname)s] [%(module)s] [%(request_id)s] %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S %z"
+
+# an id from a client is only trusted if it can't break a log line
+VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+def request_id() -> str:
+    """Returns the id of the current request, or - outside of one"""
+    if not has_request_context():
+        return "-"
+    environ = request.environ
+    if ENVIRON_KEY not in environ:
+        given = request.headers.get(REQUEST_ID_HEADER, "")
+        environ[ENVIRON_KEY] = given if VALID_REQUEST_ID.match(given) else uuid.uuid4().hex
+    return environ[ENVIRON_KEY]
+
+
+def add_request_id(response):
+    """Sends the request id back so the client can quote it"""
+    response.headers[REQUEST_ID_HEADER] = request_id()
+    return response
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the request id to every record"""
+
+    def filter(self, record):
+        record.request_id = request_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the INFO and DEBUG records of some loggers, and every warning"""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self._cache = {}
+
+    def rate(self, name: str) -> float:
+        """Returns the share to keep of a logger, from its name or the closest parent"""
+        if name not in self._cache:
+            parts = name.split(".")
+            names = (".".join(parts[:length]) for length in range(len(parts), 0, -1))
+            self._cache[name] = next((self.rates[parent] for parent in names if parent in self.rates), 1.0)
+        return self._cache[name]
+
+    def filter(self, record):
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class TextFormatter(logging.Formatter):
+    """The text format, for records with or without a request id"""
+
+    def format(self, record):
+        # gunicorn's own records reach the handlers without passing the filter
+        if not hasattr(record, "request_id"):
+            record.request_id = "-"
+        return super().format(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one line of JSON"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "pid": record.process,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """A QueueHandler that drops records instead of waiting when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The listener formats the record later, in another thread. Merge the
+        # arguments now, while they still hold what they held at the call.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # emit() runs under the handler's lock, so this count is safe
+            self.dropped += 1
+            metrics.LOG_RECORDS_DROPPED.inc()
+
+
+class LogPipeline:
+    """Writes the records of a DroppingQueueHandler to the handlers from a listener thread"""
+
+    def __init__(self, handlers: list, size: int):
+        self.handlers = handlers
+        self.size = size
+        self.handler = DroppingQueueHandler(queue.Queue(size))
+        self.listener = None
+        self.start()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.restart)
+        atexit.register(self.stop)
+
+    def start(self):
+        """Starts the listener thread"""
+        self.listener = QueueListener(self.handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def restart(self):
+        """Starts a new listener in a forked child"""
+        # Only the forking thread survives a fork, and the old queue's lock
+        # may have been held by the listener at that moment
+        self.handler.queue = queue.Queue(self.size)
+        self.handler.dropped = 0
+        self.start()
+
+    def stop(self):
+        """Writes the records still in the queue and stops the listener"""
+        if self.listener is None:
+            return
+        listener, self.listener = self.listener, None
+        try:
+            listener.stop()
+        except queue.Full:
+            # the sentinel didn't fit, so leave the daemon thread to die with the process
+            pass
+
+
+# the pipelines of this process, by the handlers they write to and their size
+_pipelines = {}
+
+
+def log_pipeline(handlers: list, size: int) -> LogPipeline:
+    """Returns the process's pipeline to the handlers, started on the first call"""
+    key = (tuple(handlers), size)
+    if key not in _pipelines:
+        _pipelines[key] = LogPipeline(handlers, size)
+    pipeline = _pipelines[key]
+    if pipeline.listener is None:
+        pipeline.start()
+    return pipeline
+
+
+class ForwardingHandler(logging.Handler):
+    """Hands the records that pass its filters to handlers it doesn't own
+
+    The filters of an app go on this handler instead of gunicorn's, so
+    creating another app never stacks a second set on them.
+    """
+
+    def __init__(self, handlers: list):
+        super().__init__()
+        self.handlers = handlers
+
+    def emit(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+def parse_rates(value: str) -> dict:
+    """Parses logger=rate pairs separated by commas, like "service=0.1,sqlalchemy=0.01" """
+    rates = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        name, _, rate = pair.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
 
 
 def init_logging(app, logger_name: str):
     """Set up logging for production"""
-    app.logger.propagate = False
     gunicorn_logger = logging.getLogger(logger_name)
-    app.logger.handlers = gunicorn_logger.handlers
-    app.logger.setLevel(gunicorn_logger.level)
+    handlers = list(gunicorn_logger.handlers)
     # Make all log formats consistent
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
-    for handler in app.logger.handlers:
+    if app.config.get("LOG_FORMAT", "text") == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = TextFormatter(TEXT_FORMAT, DATE_FORMAT)
+    for handler in handlers:
         handler.setFormatter(formatter)
+    size = app.config.get("LOG_QUEUE_SIZE", 0)
+    if handlers and size > 0:
+        pipeline = log_pipeline(handlers, size)
+        app.extensions["log_pipeline"] = pipeline
+        handlers = [pipeline.handler]
+    forwarder = ForwardingHandler(handlers)
+    forwarder.addFilter(RequestIdFilter())
+    forwarder.addFilter(SamplingFilter(app.config.get("LOG_SAMPLE_RATES", {})))
+    for logger in (app.logger, logging.getLogger(MODULE_LOGGER)):
+        logger.propagate = False
+        logger.setLevel(gunicorn_logger.level)
+        logger.handlers = [forwarder]
+    app.after_request(add_request_id)
     app.logger.info("Logging handler established")
@@ -0,0 +1,136 @@
+"""
+Prometheus Metrics
+
+This module contains the metrics the service exports on /metrics: requests
+and their latency by route and status, requests in flight, connections in
+use, cache hits and misses, and log records dropped.
+
+Under gunicorn every worker has its own counters. gunicorn.conf.py sets
+PROMETHEUS_MULTIPROC_DIR, so each worker keeps its values in a file in that
+directory and /metrics adds up the files of all of them. It doesn't matter
+which worker answers the scrape.
+"""
+import os
+import time
+import weakref
+from flask import request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client import generate_latest, multiprocess
+from sqlalchemy import event
+
+START_KEY = "service.metrics_start"
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests answered", ["method", "route", "status"]
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Seconds from the start of a request to its response",
+    ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being served", multiprocess_mode="livesum"
+)
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections lent out by the pool",
+    ["database"],
+    multiprocess_mode="livesum",
+)
+POOL_CONNECTIONS = Gauge(
+    "db_pool_connections",
+    "Connections the pool holds open",
+    ["database"],
+    multiprocess_mode="livesum",
+)
+CACHE_HITS = Counter("customer_cache_hits_total", "Customers read from the cache")
+CACHE_MISSES = Counter("customer_cache_misses_total", "Customers not found in the cache")
+LOG_RECORDS_DROPPED = Counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+
+# the engines whose pools are already watched
+_watched = weakref.WeakSet()
+
+# the labeled metrics of each (method, URL rule, status) seen so far
+_children = {}
+
+# the methods with a label of their own; a client can send any token
+METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "CONNECT", "TRACE"))
+
+
+def method_label(method: str) -> str:
+    """Returns the method of the request, or other, so clients can't add time series"""
+    return method if method in METHODS else "other"
+
+
+def route_label(rule) -> str:
+    """Returns the URL rule of the request, so every Customer shares one label"""
+    return rule.rule if rule is not None else "unmatched"
+
+
+def request_metrics(method: str, route: str, status_code: int) -> tuple:
+    """Returns the latency histogram and the counter of a kind of request"""
+    key = (method, route, status_code)
+    children = _children.get(key)
+    if children is None:
+        # labels() takes a lock and builds a key on every call, so look each
+        # combination up once
+        children = (LATENCY.labels(method, route), REQUESTS.labels(method, route, str(status_code)))
+        _children[key] = children
+    return children
+
+
+def start_timer():
+    """Counts the request as in flight and notes when it started"""
+    request.environ[START_KEY] = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def record_request(response):
+    """Counts the response and the time it took"""
+    start = request.environ.get(START_KEY)
+    if start is not None:
+        latency, counter = request_metrics(
+            method_label(request.method), route_label(request.url_rule), response.status_code
+        )
+        latency.observe(time.perf_counter() - start)
+        counter.inc()
+    return response
+
+
+def stop_timer(error=None):  # pylint: disable=unused-argument
+    """Counts the request as finished, even when it raised"""
+    if request.environ.pop(START_KEY, None) is not None:
+        IN_FLIGHT.dec()
+
+
+def watch_pool(engine, database: str):
+    """Keeps the connection gauges of the database up to date with the engine's pool"""
+    if engine in _watched:
+        return
+    _watched.add(engine)
+    checked_out = POOL_CHECKED_OUT.labels(database)
+    connections = POOL_CONNECTIONS.labels(database)
+    # the listeners stay with the pool that dispose() creates in its place
+    event.listen(engine, "checkout", lambda *args: checked_out.inc())
+    event.listen(engine, "checkin", lambda *args: checked_out.dec())
+    event.listen(engine, "connect", lambda *args: connections.inc())
+    event.listen(engine, "close", lambda *args: connections.dec())
+    event.listen(engine, "close_detached", lambda *args: connections.dec())
+
+
+def render() -> tuple:
+    """Returns the metrics of every worker in the text format, and its content type"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def init_app(app):
+    """Times every request of the app"""
+    app.before_request(start_timer)
+    app.after_request(record_request)
+    app.teardown_request(stop_timer)
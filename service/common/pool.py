@@ -0,0 +1,94 @@
+"""
+Connection Pool
+
+This module contains a QueuePool that also records how long each checkout
+waited for a connection, a function that picks the pool options for a
+database URI, and a function that reports the live state of an engine's
+pool. Every gunicorn worker has its own pool, so the numbers are
+for the worker that answers the request.
+"""
+import os
+import threading
+import time
+from sqlalchemy import exc, make_url
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that counts checkouts, timeouts and the time spent waiting"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.timeouts += timed_out
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+
+    def wait_stats(self) -> dict:
+        """Returns the checkout counters and wait times in milliseconds"""
+        with self._stats_lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_total_ms": round(self.wait_total * 1000, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "wait_avg_ms": round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+            }
+
+
+# the options engine_options() sets from DB_POOL_SIZE, DB_MAX_OVERFLOW and DB_POOL_TIMEOUT
+POOL_OPTIONS = ("poolclass", "pool_size", "max_overflow", "pool_timeout")
+
+
+def can_pool(uri: str) -> bool:
+    """Returns False for an in-memory SQLite database, which lives in a single connection"""
+    url = make_url(uri)
+    return url.get_backend_name() != "sqlite" or url.database not in (None, "", ":memory:")
+
+
+def engine_options(uri: str, config) -> dict:
+    """Returns SQLALCHEMY_ENGINE_OPTIONS with the DB_POOL_* pool when the database at uri can be pooled
+
+    The pool options already there are replaced, so the options init_db
+    stores for the primary also serve a replica at another URI
+    """
+    options = {name: value for name, value in config.get("SQLALCHEMY_ENGINE_OPTIONS", {}).items()
+               if name not in POOL_OPTIONS}
+    if can_pool(uri):
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=config.get("DB_POOL_SIZE", 5),
+            max_overflow=config.get("DB_MAX_OVERFLOW", 10),
+            pool_timeout=config.get("DB_POOL_TIMEOUT", 30.0),
+        )
+    return options
+
+
+def pool_stats(engine) -> dict:
+    """Returns the live state of the engine's pool in this process"""
+    pool = engine.pool
+    stats = {"pid": os.getpid(), "pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(pool.wait_stats())
+    return stats
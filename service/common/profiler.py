@@ -0,0 +1,161 @@
+"""
+Request Profiler
+
+This module profiles single requests on demand and writes what it found to
+PROFILE_DIR. A request is profiled when it sends the X-Profile-Token header
+with the value of PROFILE_TOKEN, or at random with PROFILE_SAMPLE_RATE.
+
+PROFILE_FORMAT picks the profiler:
+
+  pstats     cProfile, which records every call. Open the file with
+             python -m pstats, or snakeviz.
+  collapsed  a sampler that reads the stack of the request's thread every
+             PROFILE_INTERVAL_MS. It costs far less than cProfile, and the
+             file feeds flamegraph.pl or speedscope directly.
+
+Without PROFILE_DIR, or with neither a token nor a sample rate, no hooks are
+registered and requests pay nothing. A worker profiles one request at a
+time, and the requests that arrive meanwhile are not profiled.
+"""
+import cProfile
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import current_app, request
+
+logger = logging.getLogger("flask.app")
+
+ENVIRON_KEY = "service.profiler"
+TOKEN_HEADER = "X-Profile-Token"
+
+# held while a request of this worker is being profiled
+_busy = threading.Lock()
+
+
+class TracingProfiler:
+    """cProfile, writing a pstats file"""
+
+    extension = "pstats"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        """Starts recording the calls of the current thread"""
+        self.profile.enable()
+
+    def stop(self):
+        """Stops recording"""
+        self.profile.disable()
+
+    def write(self, path: str):
+        """Writes the statistics to path"""
+        self.profile.dump_stats(path)
+
+
+class SamplingProfiler:
+    """A sampler of one thread's stack, writing collapsed stacks for a flame graph"""
+
+    extension = "collapsed"
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        """Starts sampling in a thread of its own"""
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling"""
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def write(self, path: str):
+        """Writes one line per stack, the frames from the outermost and the samples"""
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in self.stacks.items():
+                file.write(f"{stack} {count}\n")
+
+
+def collapse(frame) -> str:
+    """Returns the stack that ends in frame, outermost first and separated by semicolons"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def should_profile(config) -> bool:
+    """Returns True if the request asked to be profiled or was sampled"""
+    token = request.headers.get(TOKEN_HEADER)
+    if token and config.get("PROFILE_TOKEN"):
+        return hmac.compare_digest(token.encode(), config["PROFILE_TOKEN"].encode())
+    return random.random() < config.get("PROFILE_SAMPLE_RATE", 0)
+
+
+def profile_path(directory: str, extension: str) -> str:
+    """Returns a file name that tells when and which request was profiled"""
+    path = re.sub(r"[^A-Za-z0-9]+", "_", request.path).strip("_") or "index"
+    return os.path.join(directory, f"{time.time_ns() // 1000000}-{os.getpid()}-{request.method}-{path}.{extension}")
+
+
+def start_profile():
+    """Starts a profiler for the request if it should be profiled"""
+    config = current_app.config
+    if not should_profile(config) or not _busy.acquire(blocking=False):  # pylint: disable=consider-using-with
+        return
+    if config.get("PROFILE_FORMAT") == "collapsed":
+        profiler = SamplingProfiler(threading.get_ident(), config.get("PROFILE_INTERVAL_MS", 2) / 1000)
+    else:
+        profiler = TracingProfiler()
+    try:
+        profiler.start()
+    except ValueError as error:
+        # another profiler, like a debugger, already traces this process
+        _busy.release()
+        logger.warning("Cannot profile %s %s: %s", request.method, request.path, error)
+        return
+    request.environ[ENVIRON_KEY] = profiler
+
+
+def stop_profile(error=None):  # pylint: disable=unused-argument
+    """Stops the profiler of the request and writes its file"""
+    profiler = request.environ.pop(ENVIRON_KEY, None)
+    if profiler is None:
+        return
+    try:
+        profiler.stop()
+        path = profile_path(current_app.config["PROFILE_DIR"], profiler.extension)
+        profiler.write(path)
+        logger.info("Profiled %s %s to %s", request.method, request.path, path)
+    finally:
+        _busy.release()
+
+
+def init_app(app):
+    """Profiles the requests of the app that ask for it, if profiling is configured"""
+    config = app.config
+    if not config.get("PROFILE_DIR") or not (config.get("PROFILE_TOKEN") or config.get("PROFILE_SAMPLE_RATE", 0) > 0):
+        return
+    os.makedirs(config["PROFILE_DIR"], exist_ok=True)
+    app.before_request(start_profile)
+    app.teardown_request(stop_profile)
+    logger.info("Profiling requests to %s", config["PROFILE_DIR"])
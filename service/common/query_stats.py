@@ -0,0 +1,140 @@
+"""
+Query Statistics
+
+This module times every SQL statement with SQLAlchemy engine events. For
+each request it counts the statements and the time spent in the database,
+and reports them in a Server-Timing header that the browser's developer
+tools show next to the request. It also logs:
+
+  slow statements   ones that take longer than SLOW_QUERY_MS, with the
+                    types of their parameters but not their values
+  repeats           a statement that one request runs REPEATED_QUERY_LIMIT
+                    times or more, the usual sign of an N+1 query
+
+The statements of a streamed response run after its headers are sent, so
+the header leaves them out.
+"""
+import logging
+import time
+import weakref
+from collections import Counter
+from itertools import groupby
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger("flask.app")
+
+ENVIRON_KEY = "service.queries"
+
+# the engines whose statements are already timed
+_watched = weakref.WeakSet()
+
+
+class RequestQueries:
+    """The statements one request ran and the time they took"""
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def record(self, statement: str, duration: float):
+        """Adds a statement that took duration seconds"""
+        self.count += 1
+        self.duration += duration
+        self.statements[statement] += 1
+
+    def repeated(self, limit: int) -> list:
+        """Returns (runs, statement) for every statement run at least limit times, none if limit is 0"""
+        if limit <= 0:
+            return []
+        return [(count, statement) for statement, count in self.statements.most_common() if count >= limit]
+
+    def server_timing(self) -> str:
+        """Returns the value of the Server-Timing header"""
+        return f'db;dur={self.duration * 1000:.2f};desc="{self.count} queries"'
+
+
+def parameter_shape(parameters, executemany: bool = False) -> str:
+    """Describes the parameters of a statement by their types, never their values"""
+    if executemany:
+        if not parameters:
+            return "0 x ()"
+        return f"{len(parameters)} x {parameter_shape(parameters[0])}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {type(value).__name__}" for name, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        # a long IN list or a multi-row INSERT repeats the same types
+        runs = []
+        for name, group in groupby(type(value).__name__ for value in parameters):
+            count = sum(1 for _ in group)
+            runs.append(name if count == 1 else f"{name} x {count}")
+        return "(" + ", ".join(runs) + ")"
+    return type(parameters).__name__
+
+
+def current_queries():
+    """Returns the statistics of the current request, or None outside of one"""
+    if not has_request_context():
+        return None
+    return request.environ.get(ENVIRON_KEY)
+
+
+def watch_engine(engine, slow_seconds: float):
+    """Times the statements the engine runs and logs the ones slower than slow_seconds
+
+    A negative slow_seconds turns the log off, and 0 logs every statement
+    """
+    if engine in _watched:
+        return
+    _watched.add(engine)
+
+    # pylint: disable=unused-argument,too-many-arguments
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        context.query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_timer(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.query_start
+        queries = current_queries()
+        if queries is not None:
+            queries.record(statement, duration)
+        if 0 <= slow_seconds <= duration:
+            logger.warning(
+                "Slow query, %.1f ms with parameters %s: %s",
+                duration * 1000,
+                parameter_shape(parameters, executemany),
+                " ".join(statement.split()),
+            )
+
+
+def start_request():
+    """Starts counting the statements of the request"""
+    request.environ[ENVIRON_KEY] = RequestQueries()
+
+
+def finish_request(response):
+    """Adds the Server-Timing header and logs the statements that repeated"""
+    queries = request.environ.get(ENVIRON_KEY)
+    if queries is None:
+        return response
+    if current_app.config.get("SERVER_TIMING", True):
+        response.headers.add("Server-Timing", queries.server_timing())
+    for count, statement in queries.repeated(current_app.config.get("REPEATED_QUERY_LIMIT", 5)):
+        logger.warning(
+            "Possible N+1 query, %s %s ran this %d times: %s",
+            request.method,
+            request.path,
+            count,
+            " ".join(statement.split()),
+        )
+    return response
+
+
+def init_app(app):
+    """Collects the query statistics of every request of the app"""
+    app.before_request(start_request)
+    app.after_request(finish_request)
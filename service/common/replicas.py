@@ -0,0 +1,180 @@
+"""
+Read Replicas
+
+This module sends the reads of GET and HEAD requests to read replicas and
+everything else to the primary database. Replicas are used round robin,
+and one that fails a health check is skipped until it passes the next one.
+When no replica is healthy the primary serves the read.
+
+A client that changed something is sent a cookie that keeps its reads on
+the primary for REPLICA_STICKY_SECONDS, long enough for the replicas to
+catch up, so it always reads its own writes.
+"""
+import itertools
+import logging
+import threading
+import time
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, exc, make_url, text
+from service.common import pool
+
+logger = logging.getLogger("flask.app")
+
+READ_METHODS = ("GET", "HEAD")
+STICKY_COOKIE = "primary-until"
+ENVIRON_KEY = "service.replica"
+
+
+class ReplicaRouter:
+    """Round robin over the replica engines that pass their health check"""
+
+    def __init__(self, engines: list, check_interval: float = 10.0, clock=time.monotonic):
+        self.engines = engines
+        self.check_interval = check_interval
+        self.clock = clock
+        self._healthy = [True] * len(engines)
+        self._checked = [None] * len(engines)
+        self._checking = [threading.Lock() for _ in engines]
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        for engine in engines:
+            event.listen(engine, "handle_error", self._on_error)
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates the router for DATABASE_REPLICA_URIS, or None when there are none"""
+        uris = config.get("DATABASE_REPLICA_URIS")
+        if not uris:
+            return None
+        timeout = config.get("REPLICA_CONNECT_TIMEOUT", 2)
+        engines = [create_engine(uri, **engine_options(uri, pool.engine_options(uri, config), timeout)) for uri in uris]
+        return cls(engines, config.get("REPLICA_CHECK_INTERVAL", 10.0))
+
+    def choose(self):
+        """Returns the next healthy replica engine, or None when there is none"""
+        with self._lock:
+            start = next(self._counter)
+        for offset in range(len(self.engines)):
+            index = (start + offset) % len(self.engines)
+            if self.is_healthy(index):
+                return self.engines[index]
+        return None
+
+    def is_healthy(self, index: int) -> bool:
+        """Returns the result of the last health check, checking again when it is stale
+
+        Only one thread checks a replica at a time. The others go on with the
+        last result instead of all waiting on a replica that doesn't answer.
+        """
+        checked = self._checked[index]
+        if checked is None or self.clock() - checked >= self.check_interval:
+            checking = self._checking[index]
+            if checking.acquire(blocking=False):  # pylint: disable=consider-using-with
+                try:
+                    self._healthy[index] = self._ping(self.engines[index])
+                    self._checked[index] = self.clock()
+                finally:
+                    checking.release()
+        return self._healthy[index]
+
+    def mark_down(self, engine):
+        """Takes a replica out of rotation until its next health check"""
+        index = self.engines.index(engine)
+        self._checked[index] = self.clock()
+        self._healthy[index] = False
+
+    def dispose(self):
+        """Closes the connections of every replica"""
+        for engine in self.engines:
+            engine.dispose()
+
+    def _on_error(self, context):
+        """Takes a replica out of rotation when a query loses its connection"""
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+            self.mark_down(context.engine)
+
+    @staticmethod
+    def _ping(engine) -> bool:
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            return True
+        except exc.SQLAlchemyError as error:
+            logger.warning("Replica %s is down: %s", engine.url, error)
+            return False
+
+
+def engine_options(uri: str, options: dict, connect_timeout: int) -> dict:
+    """Returns the engine options of a replica, with a connect timeout on PostgreSQL
+
+    Without one, a replica that drops packets stalls its health check until
+    the operating system gives up on the connection
+    """
+    if make_url(uri).get_backend_name() != "postgresql":
+        return options
+    connect_args = {"connect_timeout": connect_timeout, **options.get("connect_args", {})}
+    return {**options, "connect_args": connect_args}
+
+
+def replica_for_request():
+    """Returns the replica engine for the current request, or None to use the primary"""
+    if not has_request_context() or request.method not in READ_METHODS:
+        return None
+    router = current_app.extensions.get("replicas")
+    if router is None or is_sticky():
+        return None
+    # Every query of a request reads from the same replica
+    if ENVIRON_KEY not in request.environ:
+        request.environ[ENVIRON_KEY] = router.choose()
+    return request.environ[ENVIRON_KEY]
+
+
+def is_sticky() -> bool:
+    """Returns True while the client's reads must stay on the primary"""
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def reads_own_writes() -> bool:
+    """Returns True in a request that must see the client's own writes"""
+    return has_request_context() and is_sticky()
+
+
+class RoutingSession(Session):
+    """A session that runs the reads of GET and HEAD requests on a replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing:
+            replica = replica_for_request()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def init_app(app):
+    """Creates the replica router and makes writes sticky to the primary"""
+    router = ReplicaRouter.from_config(app.config)
+    previous = app.extensions.get("replicas")
+    if previous is not None:
+        previous.dispose()
+    app.extensions["replicas"] = router
+    if "replica_hooks" in app.extensions:
+        return
+    app.extensions["replica_hooks"] = True
+
+    @app.after_request
+    def stick_to_primary(response):  # pylint: disable=unused-variable
+        """Keeps a client that changed something on the primary for a while"""
+        if (
+            current_app.extensions.get("replicas") is not None
+            and request.method not in READ_METHODS
+            and response.status_code < 400
+        ):
+            seconds = current_app.config.get("REPLICA_STICKY_SECONDS", 5)
+            response.set_cookie(
+                STICKY_COOKIE, str(time.time() + seconds), max_age=seconds, httponly=True
+            )
+        return response
@@ -1,7 +1,8 @@
 """
 Descriptive HTTP status codes, for code readability.
-See RFC 2616 and RFC 6585.
+See RFC 2616, RFC 4918 and RFC 6585.
 RFC 2616: http://www.w3.org/Protocols/rfc2616/rfc2616-sec10.html
+RFC 4918: http://tools.ietf.org/html/rfc4918
 RFC 6585: http://tools.ietf.org/html/rfc6585
 """
 
@@ -17,6 +18,7 @@ HTTP_203_NON_AUTHORITATIVE_INFORMATION = 203
 HTTP_204_NO_CONTENT = 204
 HTTP_205_RESET_CONTENT = 205
 HTTP_206_PARTIAL_CONTENT = 206
+HTTP_207_MULTI_STATUS = 207
 
 # Redirection - 3xx
 HTTP_300_MULTIPLE_CHOICES = 300
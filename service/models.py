@@ -5,11 +5,15 @@ All of the models are stored in this module
 """
 import logging
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import String, cast, func, insert, inspect, select, text, update
+from service.common import bulk_load, metrics, query_stats, replicas
+from service.common.cache import NullCache, create_cache
+from service.common.pool import engine_options
 
 logger = logging.getLogger("flask.app")
 
 # Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": replicas.RoutingSession})
 
 
 # Function to initialize the database
@@ -22,16 +26,39 @@ class DataValidationError(Exception):
     """Used for an data validation errors when deserializing"""
 
 
-class Customer(db.Model):
+class Customer(db.Model):  # pylint: disable=too-many-public-methods
     """
     Class that represents a Customer
     """
 
     app = None
+    cache = NullCache()
+
+    # The serialized field names, and the attribute that holds each one
+    FIELDS = {
+        "id": "id",
+        "first_name": "first_name",
+        "last_name": "last_name",
+        "address": "address",
+        "active": "status",
+    }
 
     ##################################################
     # Table Schema
     ##################################################
+    # Indexes that match the finders, use flask db-migrate to add them to a live database
+    __table_args__ = (
+        db.Index("ix_customer_last_name_first_name", "last_name", "first_name"),
+        db.Index("ix_customer_first_name", "first_name"),
+        db.Index("ix_customer_address", "address"),
+        db.Index(
+            "ix_customer_active_id",
+            "id",
+            postgresql_where=db.text("status"),
+            sqlite_where=db.text("status"),
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(63), nullable=False)
     last_name = db.Column(db.String(63), nullable=False)
@@ -56,6 +83,7 @@ class Customer(db.Model):
         self.id = None  # pylint: disable=invalid-name
         db.session.add(self)
         db.session.commit()
+        self.cache.delete(self.id)
 
     def update(self):
         """
@@ -65,15 +93,23 @@ class Customer(db.Model):
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
         db.session.commit()
+        self.cache.delete(self.id)
 
     def delete(self):
         """Removes a Customer from the data store"""
         logger.info("Deleting %s %s", self.first_name, self.last_name)
         db.session.delete(self)
         db.session.commit()
+        self.cache.delete(self.id)
+
+    def serialize(self, fields: list = None) -> dict:
+        """Serializes a Customer into a dictionary
 
-    def serialize(self) -> dict:
-        """Serializes a Customer into a dictionary"""
+        Args:
+            fields (list): the names of the fields to include, all of them if None
+        """
+        if fields is not None:
+            return {name: getattr(self, self.FIELDS[name]) for name in fields}
         return {
             "id": self.id,
             "first_name": self.first_name,
@@ -89,9 +125,16 @@ class Customer(db.Model):
             data (dict): A dictionary containing the Customer data
         """
         try:
+            # a null or a number would only fail at the INSERT, taking the whole transaction with it
+            for name in ("first_name", "last_name", "address"):
+                if not isinstance(data[name], str):
+                    raise DataValidationError(f"Invalid type for string [{name}]: " + str(type(data[name])))
             self.first_name = data["first_name"]
             self.last_name = data["last_name"]
             self.address = data["address"]
+            reason = self.too_long()
+            if reason:
+                raise DataValidationError("Invalid customer: " + reason)
             if isinstance(data["active"], bool):
                 self.status = data["active"]
             else:
@@ -109,11 +152,34 @@ class Customer(db.Model):
             ) from error
         return self
 
+    def columns(self) -> dict:
+        """Returns the column values of a Customer, without the id"""
+        return {
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "address": self.address,
+            "status": self.status,
+        }
+
+    def too_long(self) -> str:
+        """Returns which column holds more characters than the table allows, or None"""
+        for column in self.__table__.columns:
+            length = getattr(column.type, "length", None)
+            value = getattr(self, column.key)
+            if length and isinstance(value, str) and len(value) > length:
+                return f"{column.key} is longer than {length} characters"
+        return None
+
     def deactivate(self):
         """set the status to false to deactive account"""
 
         self.status = False
 
+    def restore(self):
+        """set the status to true to restore a deactivated account"""
+
+        self.status = True
+
     ##################################################
     # Class Methods
     ##################################################
@@ -122,10 +188,194 @@ class Customer(db.Model):
         """Initializes the database session"""
         logger.info("Initializing database")
         cls.app = app
+        cls.cache = create_cache(app.config)
+        # the pool fits the URI the app uses, which a test config may have replaced
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"], app.config)
         # This is where we initialize SQLAlchemy from the Flask app
         db.init_app(app)
-        app.app_context().push()
-        db.create_all()  # make our sqlalchemy tables
+        replicas.init_app(app)
+        with app.app_context():
+            engines = [("primary", db.engine)]
+        engines += [("replica", engine) for engine in getattr(app.extensions["replicas"], "engines", [])]
+        for database, engine in engines:
+            metrics.watch_pool(engine, database)
+            query_stats.watch_engine(engine, app.config.get("SLOW_QUERY_MS", 200) / 1000)
+        # the engine only connects on the first query, so without this the
+        # worker boots without a round trip to the database
+        if app.config.get("CREATE_TABLES_ON_STARTUP", True):
+            with app.app_context():
+                db.create_all()  # make our sqlalchemy tables
+
+    @classmethod
+    def after_fork(cls, app):
+        """Gives a forked worker its own connections and cache
+
+        The pools copied from the parent may hold its connections. dispose()
+        with close=False forgets them without closing the parent's sockets,
+        and the worker opens its own on the first query.
+        """
+        logger.info("Resetting database connections after fork")
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+        router = app.extensions.get("replicas")
+        if router is not None:
+            for engine in router.engines:
+                engine.dispose(close=False)
+        cls.cache = create_cache(app.config)
+
+    @classmethod
+    def create_many(cls, customers: list, chunk_size: int = 500) -> list:
+        """Creates many Customers in a single transaction
+
+        Every chunk of Customers is written with one multi-row INSERT ... RETURNING
+
+        Args:
+            customers (list): the Customers to create
+            chunk_size (int): the number of rows per INSERT statement
+        Returns:
+            list: the new ids, in the same order as the Customers
+        """
+        logger.info("Creating %s Customers", len(customers))
+        try:
+            for start in range(0, len(customers), chunk_size):
+                chunk = customers[start:start + chunk_size]
+                statement = insert(cls).values([customer.columns() for customer in chunk]).returning(cls.id)
+                # ids are drawn from the sequence in VALUES order, so sorting them
+                # lines them up with the rows even if RETURNING reorders them
+                ids = sorted(db.session.execute(statement).scalars())
+                for customer, new_id in zip(chunk, ids):
+                    customer.id = new_id
+            db.session.commit()
+            for customer in customers:
+                cls.cache.delete(customer.id)
+        except Exception:
+            db.session.rollback()
+            raise
+        return [customer.id for customer in customers]
+
+    @classmethod
+    def load(cls, rows, chunk_size: int = 5000) -> int:
+        """Inserts a stream of Customers in a single transaction
+
+        With psycopg2 the rows are streamed to COPY FROM STDIN, elsewhere they
+        are inserted chunk_size at a time with executemany. Only one chunk is
+        held in memory, so rows can be a generator of any length. No existing
+        Customer changes, so the cache is left alone.
+
+        Args:
+            rows (iterable): the column values of each Customer, as columns() returns them
+            chunk_size (int): the rows per executemany
+        Returns:
+            int: the number of Customers that were inserted
+        """
+        logger.info("Loading Customers")
+        columns = list(cls().columns())
+        with db.engine.begin() as connection:
+            if connection.dialect.driver == "psycopg2":
+                stream = bulk_load.CopyStream(rows, columns)
+                statement = f"COPY {cls.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+                with connection.connection.cursor() as cursor:
+                    cursor.copy_expert(statement, stream, size=bulk_load.COPY_BUFFER_SIZE)
+                count = stream.count
+            else:
+                count = 0
+                for chunk in bulk_load.chunks(rows, chunk_size):
+                    connection.execute(insert(cls.__table__), chunk)
+                    count += len(chunk)
+        logger.info("Loaded %s Customers", count)
+        return count
+
+    @classmethod
+    def set_status(cls, status: bool, **filters) -> int:
+        """Sets the status of every matching Customer with a single UPDATE
+
+        Args:
+            status (bool): True to restore the Customers, False to deactivate them
+            **filters: the ids and column values that select the Customers
+        Returns:
+            int: the number of Customers that were changed
+        """
+        logger.info("Setting status to %s for %s", status, filters)
+        statement = (
+            update(cls)
+            .where(cls.status != status, *cls._criteria(**filters))
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        )
+        result = db.session.execute(statement)
+        db.session.commit()
+        if "ids" in filters:
+            for customer_id in filters["ids"]:
+                cls.cache.delete(customer_id)
+        else:
+            cls.cache.clear()
+        return result.rowcount
+
+    @classmethod
+    def _criteria(  # pylint: disable=too-many-arguments
+        cls, ids: list = None, first_name: str = None, last_name: str = None,
+        address: str = None, active: bool = None,
+    ) -> list:
+        """Returns the WHERE clauses that select Customers by ids and column values"""
+        criteria = []
+        if ids is not None:
+            criteria.append(cls.id.in_(ids))
+        if first_name is not None:
+            criteria.append(cls.first_name == first_name)
+        if last_name is not None:
+            criteria.append(cls.last_name == last_name)
+        if address is not None:
+            criteria.append(cls.address == address)
+        if active is not None:
+            criteria.append(cls.status == active)
+        return criteria
+
+    @classmethod
+    def create_indexes(cls) -> list:
+        """Creates the indexes that are missing from a live database
+
+        On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY so the
+        table stays writable. That cannot run inside a transaction, so every
+        statement is committed on its own. A concurrent build that failed leaves
+        an invalid index under its name, which is dropped and built again.
+
+        Returns:
+            list: the names of the indexes that were created
+        """
+        created = []
+        with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            existing = {index["name"] for index in inspect(connection).get_indexes(cls.__tablename__)}
+            invalid = cls.invalid_indexes(connection)
+            for index in sorted(cls.__table__.indexes, key=lambda index: index.name):
+                if index.name in existing and index.name not in invalid:
+                    continue
+                logger.info("Creating index %s", index.name)
+                index.dialect_options["postgresql"]["concurrently"] = True
+                try:
+                    if index.name in invalid:
+                        logger.warning("Dropping invalid index %s", index.name)
+                        index.drop(connection)
+                    index.create(connection)
+                finally:
+                    # create_all() runs in a transaction, so don't leave it on
+                    index.dialect_options["postgresql"]["concurrently"] = False
+                created.append(index.name)
+        return created
+
+    @classmethod
+    def invalid_indexes(cls, connection) -> set:
+        """Returns the names of the indexes of the table that PostgreSQL marked invalid"""
+        if connection.dialect.name != "postgresql":
+            return set()
+        return set(connection.scalars(
+            text(
+                "SELECT index_class.relname FROM pg_index"
+                " JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid"
+                " WHERE pg_index.indrelid = to_regclass(:name) AND NOT pg_index.indisvalid"
+            ),
+            {"name": cls.__tablename__},
+        ))
 
     @classmethod
     def all(cls):
@@ -139,6 +389,138 @@ class Customer(db.Model):
         logger.info("Processing lookup for id %s ...", by_id)
         return cls.query.get(by_id)
 
+    @classmethod
+    def find_for_update(cls, by_id):
+        """Finds a Customer by its ID and locks its row until the transaction ends
+
+        A check of the Customer, like If-Match, then holds until the update
+        commits, so two requests that pass it can't both write
+        """
+        logger.info("Processing locked lookup for id %s ...", by_id)
+        return db.session.get(cls, by_id, with_for_update=True, populate_existing=True)
+
+    @classmethod
+    def search(cls, **filters):
+        """Returns the Customers that match every one of the filters
+
+        The filters are ANDed into a single statement, always in the same column
+        order so that equal combinations of filters produce the same SQL
+
+        Args:
+            **filters: any of ids, first_name, last_name, address and active
+        """
+        logger.info("Processing search for %s ...", filters)
+        return cls.query.filter(*cls._criteria(**filters))
+
+    @classmethod
+    def count(cls, **filters) -> int:
+        """Returns the number of Customers that match every one of the filters
+
+        Args:
+            **filters: any of ids, first_name, last_name, address and active
+        """
+        logger.info("Processing count for %s ...", filters)
+        return db.session.execute(cls.count_statement(**filters)).scalar_one()
+
+    @classmethod
+    def count_statement(cls, **filters):
+        """Returns the SELECT COUNT(*) of the Customers that match the filters"""
+        return select(func.count()).select_from(cls).where(*cls._criteria(**filters))  # pylint: disable=not-callable
+
+    @classmethod
+    def estimate_statement(cls):
+        """Returns the statement that reads PostgreSQL's estimate of the rows, -1 before the first ANALYZE"""
+        return text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)").bindparams(
+            name=cls.__tablename__
+        )
+
+    @classmethod
+    def estimated_count(cls) -> tuple:
+        """Returns about how many Customers there are without scanning the table
+
+        PostgreSQL keeps an estimate in its planner statistics. Other databases,
+        and tables that have never been analyzed, get an exact count instead.
+
+        Returns:
+            tuple: (count, estimated), where estimated is False for an exact count
+        """
+        logger.info("Processing estimated count ...")
+        if db.engine.dialect.name == "postgresql":
+            estimate = db.session.execute(cls.estimate_statement()).scalar()
+            if estimate is not None and estimate >= 0:
+                return estimate, True
+        return cls.count(), False
+
+    @classmethod
+    def find_data(cls, by_id) -> dict:
+        """Returns a serialized Customer by its ID, from the cache if it is there
+
+        Only a lookup in a cache other than NullCache counts as a hit or a
+        miss. A client that must read its own writes always reads the database,
+        and what a replica returns is never cached, because it may lag
+        behind the primary.
+
+        Args:
+            by_id (int): the id of the Customer
+        Returns:
+            dict: the serialized Customer, or None if there is no such Customer
+        """
+        data = None
+        # only a lookup in a real cache is a hit or a miss
+        if not isinstance(cls.cache, NullCache) and not replicas.reads_own_writes():
+            data = cls.cache.get(by_id)  # pylint: disable=assignment-from-none
+            (metrics.CACHE_MISSES if data is None else metrics.CACHE_HITS).inc()
+        if data is None:
+            customer = cls.find(by_id)
+            if customer is None:
+                return None
+            data = customer.serialize()
+            if replicas.replica_for_request() is None:
+                cls.cache.set(by_id, data)
+        return dict(data)
+
+    @classmethod
+    def find_rows(cls, fields: list, after_id: int = None, limit: int = None, **filters) -> list:
+        """Returns one page of Customers as plain rows, without creating ORM objects
+
+        Every row holds the named fields in the order given, with the id as a
+        string like the REST API sends it, followed by the integer id for paging
+
+        Args:
+            fields (list): the names of the serialized fields to select
+            after_id (int): only return Customers with an id greater than this one
+            limit (int): the maximum number of rows to return
+            **filters: any of ids, first_name, last_name, address and active
+        """
+        logger.info("Processing rows after id %s limited to %s for %s ...", after_id, limit, filters)
+        statement = cls.rows_statement(fields, after_id, **filters).limit(limit)
+        return db.session.execute(statement).all()
+
+    @classmethod
+    def stream_rows(cls, fields: list, after_id: int = None, batch_size: int = 1000, **filters):
+        """Yields the rows of find_rows() for every matching Customer
+
+        Rows are fetched batch_size at a time from a server-side cursor
+        """
+        logger.info("Processing row stream after id %s for %s ...", after_id, filters)
+        statement = cls.rows_statement(fields, after_id, **filters)
+        result = db.session.execute(statement, execution_options={"yield_per": batch_size})
+        yield from result  # pylint: disable=not-an-iterable
+
+    @classmethod
+    def rows_statement(cls, fields: list, after_id: int = None, **filters):
+        """Returns the Core SELECT of the named fields behind find_rows()"""
+        columns = []
+        for name in fields:
+            column = getattr(cls, cls.FIELDS[name])
+            if name == "id":
+                column = cast(column, String)
+            columns.append(column.label(name))
+        statement = select(*columns, cls.id).where(*cls._criteria(**filters))
+        if after_id is not None:
+            statement = statement.where(cls.id > after_id)
+        return statement.order_by(cls.id)
+
     @classmethod
     def find_by_first_name(cls, first_name: str) -> list:
         """Returns all Customers with the first name
@@ -151,7 +533,7 @@ class Customer(db.Model):
 
         """
         logger.info("Processing first name query for %s ...", first_name)
-        return cls.query.filter(cls.first_name == first_name)
+        return cls.search(first_name=first_name)
 
     @classmethod
     def find_by_last_name(cls, last_name: str) -> list:
@@ -165,7 +547,7 @@ class Customer(db.Model):
 
         """
         logger.info("Processing last name query for %s ...", last_name)
-        return cls.query.filter(cls.last_name == last_name)
+        return cls.search(last_name=last_name)
 
     # @classmethod
     # def find_by_address(cls, address:str) -> list:
@@ -178,9 +560,7 @@ class Customer(db.Model):
             name (string): the name of the Customers you want to match
         """
         logger.info("Processing name query for %s %s ...", first_name, last_name)
-        return cls.query.filter(
-            cls.first_name == first_name, cls.last_name == last_name
-        )
+        return cls.search(first_name=first_name, last_name=last_name)
 
     @classmethod
     def find_by_address(cls, address: str) -> list:
@@ -190,4 +570,4 @@ class Customer(db.Model):
             address (string): the address of the Customers
         """
         logger.info("Processing address query for %s ...", address)
-        return cls.query.filter(cls.address == address)
+        return cls.search(address=address)
@@ -4,11 +4,57 @@ My Service
 Describe what your service does here
 """
 
-from flask import jsonify, abort
-from flask_restx import Resource, fields, reqparse, inputs
-from service.common import status  # HTTP Status Codes
-from service.models import Customer
-from . import app, api
+import base64
+import binascii
+import hashlib
+import itertools
+import json
+import os
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from flask_restx import Api, Resource, fields, reqparse, inputs
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import quote_etag
+from service.common import metrics, status  # HTTP Status Codes
+from service.common.error_handlers import error_body
+from service.common.json_provider import compact_dumps, output_json
+from service.common.pool import pool_stats
+from service.models import Customer, DataValidationError, db
+
+# The routes outside of the REST API
+blueprint = Blueprint("service", __name__)
+
+######################################################################
+# Configure Swagger before initializing it
+######################################################################
+api = Api(
+    version="1.0.0",
+    title="Customer Demo REST API Service",
+    description="This is a sample customer server.",
+    default="customers",
+    default_label="Customer operations",
+    doc="/apidocs",
+    prefix="/api",
+)
+api.representations["application/json"] = output_json
+
+
+######################################################################
+# Errors of the REST API, in the same shape as those of the app
+######################################################################
+@api.errorhandler(DataValidationError)
+def api_validation_error(error):
+    """Handles bad data sent to a REST API resource"""
+    current_app.logger.warning(str(error))
+    return error_body(status.HTTP_400_BAD_REQUEST, str(error)), status.HTTP_400_BAD_REQUEST
+
+
+@api.errorhandler(HTTPException)
+def api_http_error(error):
+    """Handles the errors a REST API resource aborts with"""
+    body = error_body(error.code, error.description)
+    # the request parser keeps the invalid arguments in data, which replaces the body
+    error.data = {**body, **getattr(error, "data", {})}
+    return error.data, error.code
 
 
 ######################################################################
@@ -16,21 +62,49 @@ from . import app, api
 ######################################################################
 
 
-@app.route("/")
+@blueprint.route("/")
 def index():
     """Base URL for our service"""
-    return app.send_static_file("index.html")
+    return current_app.send_static_file("index.html")
 
 
 ######################################################################
 # check service health
 ######################################################################
-@app.route("/health")
+@blueprint.route("/health")
 def health():
     """Health Status"""
     return jsonify({"status": "OK"}), status.HTTP_200_OK
 
 
+######################################################################
+# database connection pool statistics of this worker
+######################################################################
+@blueprint.route("/stats/pool")
+def pool_statistics():
+    """Connection pool statistics"""
+    return jsonify(pool_stats(db.engine)), status.HTTP_200_OK
+
+
+######################################################################
+# Customer cache statistics of this worker
+######################################################################
+@blueprint.route("/stats/cache")
+def cache_statistics():
+    """Customer cache statistics"""
+    return jsonify(pid=os.getpid(), backend=type(Customer.cache).__name__, **Customer.cache.stats()), status.HTTP_200_OK
+
+
+######################################################################
+# Prometheus metrics of all the workers
+######################################################################
+@blueprint.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics"""
+    data, content_type = metrics.render()
+    return Response(data, status=status.HTTP_200_OK, content_type=content_type)
+
+
 # Define the model so that the docs reflect what can be sent
 create_model = api.model(
     "Customer",
@@ -61,30 +135,57 @@ customer_model = api.inherit(
     },
 )
 
-# query string arguments
-customer_args = reqparse.RequestParser()
-customer_args.add_argument(
+# The Customers to change in a bulk operation
+bulk_model = api.model(
+    "Bulk",
+    {
+        "ids": fields.List(
+            fields.Integer, description="The ids of the Customers, or use the filters"
+        ),
+    },
+)
+
+bulk_result_model = api.model(
+    "BulkResult",
+    {"count": fields.Integer(description="The number of Customers changed")},
+)
+
+# The outcome of creating one Customer in a batch
+batch_result_model = api.model(
+    "BatchResult",
+    {
+        "id": fields.String(description="The id of the Customer that was created"),
+        "error": fields.String(description="Why the Customer could not be created"),
+    },
+)
+
+# Media type of the streaming list, one JSON document per line
+NDJSON = "application/x-ndjson"
+
+# query string arguments that select Customers
+filter_args = reqparse.RequestParser()
+filter_args.add_argument(
     "first_name",
     type=str,
     location="args",
     required=False,
     help="List Customers by first name",
 )
-customer_args.add_argument(
+filter_args.add_argument(
     "last_name",
     type=str,
     location="args",
     required=False,
     help="List Customers by last name",
 )
-customer_args.add_argument(
+filter_args.add_argument(
     "address",
     type=str,
     location="args",
     required=False,
     help="List Customers by address",
 )
-customer_args.add_argument(
+filter_args.add_argument(
     "active",
     type=inputs.boolean,
     location="args",
@@ -92,6 +193,121 @@ customer_args.add_argument(
     help="List Customers by active",
 )
 
+
+def field_list(value: str) -> list:
+    """Parses a comma separated list of Customer fields"""
+    names = list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    unknown = [name for name in names if name not in Customer.FIELDS]
+    if not names or unknown:
+        raise ValueError(f"Unknown fields {unknown}, choose from {', '.join(Customer.FIELDS)}")
+    return names
+
+
+# query string arguments of a single Customer
+item_args = reqparse.RequestParser()
+item_args.add_argument(
+    "fields",
+    type=field_list,
+    location="args",
+    required=False,
+    help="Comma separated list of the fields to return, all fields if left out",
+)
+
+# query string arguments of the list
+customer_args = filter_args.copy()
+customer_args.add_argument(item_args.args[0])
+customer_args.add_argument(
+    "limit",
+    type=inputs.positive,
+    location="args",
+    required=False,
+    help="The maximum number of Customers to return in one page",
+)
+customer_args.add_argument(
+    "cursor",
+    type=str,
+    location="args",
+    required=False,
+    help="The opaque cursor returned in the Link header of the previous page",
+)
+
+
+# query string arguments of the count
+count_args = filter_args.copy()
+count_args.add_argument(
+    "estimate",
+    type=inputs.boolean,
+    location="args",
+    required=False,
+    default=False,
+    help="Return a fast estimate from planner statistics when there are no filters",
+)
+
+count_model = api.model(
+    "Count",
+    {
+        "count": fields.Integer(description="The number of matching Customers"),
+        "estimated": fields.Boolean(description="True if the count is an estimate"),
+    },
+)
+
+
+def count_customers() -> tuple:
+    """Counts the Customers selected by the filters, returns (count, estimated)"""
+    args = count_args.parse_args()
+    filters = selected_filters(args)
+    if args["estimate"] and not filters:
+        return Customer.estimated_count()
+    return Customer.count(**filters), False
+
+
+def projected_model(names: list) -> dict:
+    """Returns the part of customer_model with only the named fields"""
+    if names is None:
+        return customer_model
+    return {name: customer_model.resolved[name] for name in names}
+
+
+def selected_filters(args) -> dict:
+    """Returns the filters in the parsed arguments that were given a value"""
+    filters = {}
+    for argument in filter_args.args:
+        if args[argument.name] is not None:
+            filters[argument.name] = args[argument.name]
+    return filters
+
+
+######################################################################
+# Entity tags for conditional requests
+######################################################################
+def etag_for(data) -> str:
+    """Returns a strong entity tag that changes whenever the serialized data does"""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def not_modified(etag: str) -> Response:
+    """Returns an empty 304 Not Modified response for the entity tag"""
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": quote_etag(etag)})
+
+
+######################################################################
+# Keyset pagination cursors
+######################################################################
+def encode_cursor(last_id: int) -> str:
+    """Turns the id of the last Customer on a page into an opaque cursor"""
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    """Turns an opaque cursor back into the id of the last Customer seen"""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(cursor + padding).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        abort(status.HTTP_400_BAD_REQUEST, f"Invalid cursor '{cursor}'.")
+    return None  # never reached, abort() raises
+
 ######################################################################
 #  R E S T   A P I   E N D P O I N T S
 ######################################################################
@@ -116,25 +332,32 @@ class CustomerResource(Resource):
     # READ A Customer
     # ------------------------------------------------------------------
     @api.doc("get_customers")
+    @api.expect(item_args, validate=True)
+    @api.response(200, "Success", customer_model)
+    @api.response(304, "Customer not modified since the ETag in If-None-Match")
     @api.response(404, "Customer not found")
-    @api.marshal_with(customer_model)
     def get(self, customer_id):
         """
         Retrieve a single Customer
 
         This endpoint will return a Customer based on it's id
         """
-        app.logger.info("Request to Retrieve a customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
-        if not customer or not customer.status:
+        current_app.logger.info("Request to Retrieve a customer with id [%s]", customer_id)
+        names = item_args.parse_args()["fields"]
+        data = Customer.find_data(customer_id)
+        if not data or not data["active"]:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Customer with id '{customer_id}' was not found.",
             )
-        app.logger.info(
-            "Returning customer: %s %s", customer.first_name, customer.last_name
-        )
-        return customer.serialize(), status.HTTP_200_OK
+        if names:
+            data = {name: data[name] for name in names}
+        etag = etag_for(data)
+        if request.if_none_match.contains_weak(etag):
+            current_app.logger.info("Customer with id [%s] not modified", customer_id)
+            return not_modified(etag)
+        current_app.logger.info("Returning customer with id [%s]", customer_id)
+        return api.marshal(data, projected_model(names)), status.HTTP_200_OK, {"ETag": quote_etag(etag)}
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING Customer
@@ -142,6 +365,7 @@ class CustomerResource(Resource):
     @api.doc("update_customers")
     @api.response(404, "Customer not found")
     @api.response(400, "The posted Customer data was not valid")
+    @api.response(412, "Customer changed since the ETag in If-Match")
     @api.expect(customer_model)
     @api.marshal_with(customer_model)
     def put(self, customer_id):
@@ -150,14 +374,20 @@ class CustomerResource(Resource):
 
         This endpoint will update a Customer based the body that is posted
         """
-        app.logger.info("Request to update a customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
+        current_app.logger.info("Request to update a customer with id [%s]", customer_id)
+        # locked, so no other update can land between the If-Match check and the commit
+        customer = Customer.find_for_update(customer_id)
         if not customer or not customer.status:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Customer with id '{customer_id}' was not found.",
             )
-        app.logger.debug("Payload = %s", api.payload)
+        if request.if_match and not request.if_match.contains(etag_for(customer.serialize())):
+            abort(
+                status.HTTP_412_PRECONDITION_FAILED,
+                f"Customer with id '{customer_id}' has been changed by someone else.",
+            )
+        current_app.logger.debug("Payload = %s", api.payload)
         data = api.payload
         customer.deserialize(data)
         if not customer.status:
@@ -168,8 +398,9 @@ class CustomerResource(Resource):
         customer.id = customer_id
         customer.update()
 
-        app.logger.info("Customer with ID [%s] updated.", customer.id)
-        return customer.serialize(), status.HTTP_200_OK
+        current_app.logger.info("Customer with ID [%s] updated.", customer.id)
+        data = customer.serialize()
+        return data, status.HTTP_200_OK, {"ETag": quote_etag(etag_for(data))}
 
     # ------------------------------------------------------------------
     # DELETE A Customer
@@ -182,11 +413,11 @@ class CustomerResource(Resource):
 
         This endpoint will delete a Customer based the id specified in the path
         """
-        app.logger.info("Request to Delete a customer with id [%s]", customer_id)
+        current_app.logger.info("Request to Delete a customer with id [%s]", customer_id)
         customer = Customer.find(customer_id)
         if customer:
             customer.delete()
-            app.logger.info("Customer with id [%s] was deleted", customer_id)
+            current_app.logger.info("Customer with id [%s] was deleted", customer_id)
 
         return "", status.HTTP_204_NO_CONTENT
 
@@ -203,33 +434,79 @@ class CustomerCollection(Resource):
     # ------------------------------------------------------------------
     @api.doc("list_customers")
     @api.expect(customer_args, validate=True)
-    @api.marshal_list_with(customer_model)
+    @api.produces(["application/json", NDJSON])
+    @api.response(200, "Success", [customer_model])
+    @api.response(304, "List not modified since the ETag in If-None-Match")
     def get(self):
-        """Returns all of the Customers"""
-        app.logger.info("Request for customer list")
-        customers = []
+        """
+        Returns one page of the Customers
+        Send Accept: application/x-ndjson to stream every matching Customer instead
+        """
+        current_app.logger.info("Request for customer list")
         args = customer_args.parse_args()
-        if args["first_name"] and args["last_name"]:
-            app.logger.info(
-                "Filtering by name: %s %s", args["first_name"], args["last_name"]
-            )
-            customers = Customer.find_by_name(args["first_name"], args["last_name"])
-        elif args["first_name"]:
-            app.logger.info("Filtering by first name: %s", args["first_name"])
-            customers = Customer.find_by_first_name(args["first_name"])
-        elif args["last_name"]:
-            app.logger.info("Filtering by last name: %s", args["last_name"])
-            customers = Customer.find_by_last_name(args["last_name"])
-        elif args["address"]:
-            app.logger.info("Filtering by address: %s", args["address"])
-            customers = Customer.find_by_address(args["address"])
+        names = args["fields"] or list(Customer.FIELDS)
+        filters = selected_filters(args)
+        if filters:
+            current_app.logger.info("Filtering by %s", filters)
         else:
-            app.logger.info("Returning unfiltered list.")
-            customers = Customer.all()
+            current_app.logger.info("Returning unfiltered list.")
+        after_id = decode_cursor(args["cursor"]) if args["cursor"] else None
+
+        if request.accept_mimetypes.best_match(["application/json", NDJSON]) == NDJSON:
+            current_app.logger.info("Streaming customer list as %s", NDJSON)
+            rows = Customer.stream_rows(names, after_id, current_app.config["STREAM_BATCH_SIZE"], **filters)
+            if args["limit"]:
+                rows = itertools.islice(rows, args["limit"])
+            return Response(stream_with_context(self._ndjson(rows, names)), mimetype=NDJSON)
+
+        limit = min(args["limit"] or current_app.config["DEFAULT_PAGE_SIZE"], current_app.config["MAX_PAGE_SIZE"])
+        rows = Customer.find_rows(names, after_id, limit, **filters)
+
+        # the rows already hold the wire format, so they skip marshalling
+        results = [dict(zip(names, row)) for row in rows]
+        etag = etag_for(results)
+        if request.if_none_match.contains_weak(etag):
+            current_app.logger.info("Customer list not modified")
+            return not_modified(etag)
+        current_app.logger.info("[%s] Customers returned", len(results))
+        headers = {"ETag": quote_etag(etag)}
+        if len(rows) == limit:
+            headers["Link"] = self._next_link(args, rows[-1][-1], limit)
+        return results, status.HTTP_200_OK, headers
 
-        results = [customer.serialize() for customer in customers]
-        app.logger.info("[%s] Customers returned", len(results))
-        return results, status.HTTP_200_OK
+    # ------------------------------------------------------------------
+    # COUNT THE Customers WITHOUT SENDING THEM
+    # ------------------------------------------------------------------
+    @api.doc("count_customers_head")
+    @api.expect(count_args, validate=True)
+    @api.response(200, "The count is in the X-Total-Count header")
+    def head(self):
+        """Returns the number of matching Customers in the X-Total-Count header"""
+        current_app.logger.info("Request for customer count")
+        count, estimated = count_customers()
+        headers = {"X-Total-Count": str(count)}
+        if estimated:
+            headers["X-Total-Count-Estimated"] = "true"
+        return Response(status=status.HTTP_200_OK, headers=headers)
+
+    @staticmethod
+    def _ndjson(rows, names):
+        """Yields one line of JSON for every Customer"""
+        count = 0
+        for row in rows:
+            count += 1
+            yield compact_dumps(dict(zip(names, row))) + "\n"
+        current_app.logger.info("[%s] Customers streamed", count)
+
+    @staticmethod
+    def _next_link(args, last_id, limit):
+        """Builds the Link header that points to the page after last_id"""
+        params = {key: value for key, value in args.items() if value is not None}
+        if args["fields"]:
+            params["fields"] = ",".join(args["fields"])
+        params.update(cursor=encode_cursor(last_id), limit=limit)
+        url = api.url_for(CustomerCollection, _external=True, **params)
+        return f'<{url}>; rel="next"'
 
     # ------------------------------------------------------------------
     # ADD A NEW Customer
@@ -243,18 +520,181 @@ class CustomerCollection(Resource):
         Creates a Customer
         This endpoint will create a Customer based the data in the body that is posted
         """
-        app.logger.info("Request to Create a Customer")
+        current_app.logger.info("Request to Create a Customer")
         customer = Customer()
-        # app.logger.debug("Payload = %s", api.payload)
+        # current_app.logger.debug("Payload = %s", api.payload)
         customer.deserialize(api.payload)
         customer.create()
-        app.logger.info("Customer with new id [%s] created!", customer.id)
+        current_app.logger.info("Customer with new id [%s] created!", customer.id)
         location_url = api.url_for(
             CustomerResource, customer_id=customer.id, _external=True
         )
         return customer.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
 
 
+######################################################################
+#  PATH: /customers/count
+######################################################################
+@api.route("/customers/count", strict_slashes=False)
+class CustomerCount(Resource):
+    """Handles counting Customers"""
+
+    @api.doc("count_customers")
+    @api.expect(count_args, validate=True)
+    @api.marshal_with(count_model)
+    def get(self):
+        """
+        Count the Customers
+        This endpoint will return the number of Customers that match the filters
+        """
+        current_app.logger.info("Request for customer count")
+        count, estimated = count_customers()
+        current_app.logger.info("[%s] Customers counted", count)
+        return {"count": count, "estimated": estimated}, status.HTTP_200_OK
+
+
+######################################################################
+#  PATH: /customers/batch
+######################################################################
+@api.route("/customers/batch", strict_slashes=False)
+class CustomerBatch(Resource):
+    """Handles creating many Customers at once"""
+
+    # ------------------------------------------------------------------
+    # ADD MANY NEW Customers
+    # ------------------------------------------------------------------
+    @api.doc("create_customers_batch")
+    @api.response(201, "All of the Customers were created", [batch_result_model])
+    @api.response(207, "Some of the Customers were created", [batch_result_model])
+    @api.response(400, "None of the posted Customers were valid")
+    @api.response(413, "Too many Customers in one batch")
+    @api.response(415, "The body was not JSON or NDJSON")
+    @api.expect([create_model])
+    def post(self):
+        """
+        Creates many Customers
+        This endpoint takes a JSON array or NDJSON lines of Customers, creates the
+        valid ones in a single transaction and reports an id or an error for each
+        """
+        current_app.logger.info("Request to Create a batch of Customers")
+        items = self._read_items()
+        if not items:
+            abort(status.HTTP_400_BAD_REQUEST, "The batch did not contain any Customers.")
+        if len(items) > current_app.config["MAX_BATCH_SIZE"]:
+            abort(
+                status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                f"A batch can have at most {current_app.config['MAX_BATCH_SIZE']} Customers.",
+            )
+
+        results = []
+        customers = []
+        for item in items:
+            try:
+                if isinstance(item, DataValidationError):
+                    raise item
+                customers.append(Customer().deserialize(item))
+                results.append(customers[-1])
+            except DataValidationError as error:
+                results.append({"error": str(error)})
+
+        Customer.create_many(customers, current_app.config["BATCH_CHUNK_SIZE"])
+        results = [
+            {"id": result.id} if isinstance(result, Customer) else result
+            for result in results
+        ]
+        current_app.logger.info("[%s] of [%s] Customers created", len(customers), len(items))
+
+        if not customers:
+            code = status.HTTP_400_BAD_REQUEST
+        elif len(customers) < len(items):
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_201_CREATED
+        return api.marshal(results, batch_result_model, skip_none=True), code
+
+    @staticmethod
+    def _read_items() -> list:
+        """Returns the posted items, with a DataValidationError for every bad NDJSON line"""
+        if request.mimetype == NDJSON:
+            items = []
+            for line in request.get_data(as_text=True).splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    items.append(json.loads(line))
+                except ValueError as error:
+                    items.append(DataValidationError(f"Invalid JSON line: {error}"))
+            return items
+        if request.mimetype != "application/json":
+            abort(
+                status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                f"Content-Type must be application/json or {NDJSON}",
+            )
+        items = request.get_json(silent=True)
+        if not isinstance(items, list):
+            abort(status.HTTP_400_BAD_REQUEST, "The batch must be a JSON array of Customers.")
+        return items
+
+
+######################################################################
+#  PATH: /customers/deactivate and /customers/restore
+######################################################################
+def set_status_in_bulk(active: bool) -> int:
+    """Sets the status of the Customers selected by ids in the body or by the filters"""
+    filters = selected_filters(filter_args.parse_args())
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids") if isinstance(data, dict) else None
+    if ids is not None:
+        if not isinstance(ids, list) or not all(
+            isinstance(customer_id, int) and not isinstance(customer_id, bool) for customer_id in ids
+        ):
+            abort(status.HTTP_400_BAD_REQUEST, "ids must be a list of Customer ids.")
+        filters["ids"] = ids
+    if not filters:
+        abort(
+            status.HTTP_400_BAD_REQUEST,
+            "Select the Customers with a list of ids or at least one filter.",
+        )
+    current_app.logger.info("Request to set active=%s for Customers matching %s", active, filters)
+    count = Customer.set_status(active, **filters)
+    current_app.logger.info("[%s] Customers set to active=%s", count, active)
+    return count
+
+
+@api.route("/customers/deactivate", strict_slashes=False)
+class BulkDeactivateResource(Resource):
+    """Handles deactivating many Customers at once"""
+
+    @api.doc("deactivate_customers_bulk")
+    @api.expect(filter_args, bulk_model)
+    @api.response(400, "No Customers were selected")
+    @api.marshal_with(bulk_result_model)
+    def put(self):
+        """
+        Deactivate many Customers
+        This endpoint will deactivate the Customers with the ids in the body, or the
+        Customers that match the filters in the query string, with a single UPDATE
+        """
+        return {"count": set_status_in_bulk(False)}, status.HTTP_200_OK
+
+
+@api.route("/customers/restore", strict_slashes=False)
+class BulkRestoreResource(Resource):
+    """Handles restoring many Customers at once"""
+
+    @api.doc("restore_customers_bulk")
+    @api.expect(filter_args, bulk_model)
+    @api.response(400, "No Customers were selected")
+    @api.marshal_with(bulk_result_model)
+    def put(self):
+        """
+        Restore many Customers
+        This endpoint will restore the Customers with the ids in the body, or the
+        Customers that match the filters in the query string, with a single UPDATE
+        """
+        return {"count": set_status_in_bulk(True)}, status.HTTP_200_OK
+
+
 ######################################################################
 #  PATH: /customers/{id}/deactivate
 ######################################################################
@@ -272,17 +712,18 @@ class DeactivateResource(Resource):
 
         This endpoint will deactivate a Customer based the id specified in the path
         """
-        app.logger.info("Request to deactivate customer with id: %s", customer_id)
+        current_app.logger.info("Request to deactivate customer with id: %s", customer_id)
         customer = Customer.find(customer_id)
         if customer:
             customer.deactivate()
+            customer.update()
         else:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Customer with id '{customer_id}' was not found.",
             )
 
-        app.logger.info("Customer with ID [%s] deactivate complete.", customer_id)
+        current_app.logger.info("Customer with ID [%s] deactivate complete.", customer_id)
         return "", status.HTTP_200_OK
 
 
@@ -302,13 +743,14 @@ class RestoreResource(Resource):
         """
         Restore the account by its ID
         """
-        app.logger.info("Request for restoring customer with id: %s", customer_id)
+        current_app.logger.info("Request for restoring customer with id: %s", customer_id)
         customer = Customer.find(customer_id)
         if not customer:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Customer with id '{customer_id}' was not found.",
             )
-        customer.status = True
-        app.logger.info("Customer with ID [%s] restored.", customer.id)
+        customer.restore()
+        customer.update()
+        current_app.logger.info("Customer with ID [%s] restored.", customer.id)
         return customer.serialize(), status.HTTP_200_OK
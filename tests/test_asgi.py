@@ -0,0 +1,244 @@
+"""
+Test cases for the ASGI Service
+
+The tests drive the ASGI application directly, the way uvicorn would
+"""
+import asyncio
+import json
+import logging
+import re
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from service import create_app
+from service.asgi import CustomerApp, async_uri, create_application
+from service.models import db, Customer
+from service.common import status  # HTTP Status Codes
+from tests.factories import CustomerFactory
+
+BASE_URL = "/api/customers"
+
+app = create_app({"TESTING": True})
+
+
+async def call(  # pylint: disable=too-many-arguments
+    application, method: str, path: str, query: str = "", body=None, headers: dict = None
+):
+    """Sends one request to the ASGI application, returns (status, headers, data)"""
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "scheme": "http",
+        "query_string": query.encode(),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+    }
+    if body is not None and not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    messages = [{"type": "http.request", "body": body or b"", "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await application(scope, receive, send)
+    response_headers = {name.decode(): value.decode() for name, value in sent[0]["headers"]}
+    content = sent[1]["body"]
+    return sent[0]["status"], response_headers, json.loads(content) if content else None
+
+
+######################################################################
+#  A S G I   T E S T   C A S E S
+######################################################################
+class TestAsgiService(IsolatedAsyncioTestCase):
+    """ASGI Service Tests"""
+
+    application = None
+    context = None
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+
+    async def asyncSetUp(self):
+        """Runs before each test"""
+        self.context = app.app_context()
+        self.context.push()
+        db.session.query(Customer).delete()
+        db.session.commit()
+        Customer.cache.clear()
+        self.application = CustomerApp(app)
+
+    async def asyncTearDown(self):
+        await self.application.engine.dispose()
+        db.session.remove()
+        self.context.pop()
+
+    async def _create(self, **kwargs):
+        """Creates a Customer through the ASGI application"""
+        code, _, data = await call(self.application, "POST", BASE_URL, body=CustomerFactory(**kwargs).serialize())
+        self.assertEqual(code, status.HTTP_201_CREATED)
+        return data
+
+    def test_async_uri(self):
+        """It should pick the async driver for the database"""
+        self.assertEqual(async_uri("postgresql://u:p@db:5432/x"), "postgresql+asyncpg://u:p@db:5432/x")
+        self.assertEqual(async_uri("sqlite:////tmp/x.db"), "sqlite+aiosqlite:////tmp/x.db")
+        self.assertEqual(async_uri("mysql+aiomysql://db/x"), "mysql+aiomysql://db/x")
+
+    async def test_health(self):
+        """It should be healthy"""
+        code, _, data = await call(self.application, "GET", "/health")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(data, {"status": "OK"})
+
+    async def test_create_application(self):
+        """It should build the Flask application only when the server calls the factory"""
+        with patch("service.asgi.create_app", return_value=app) as factory:
+            application = create_application()
+        factory.assert_called_once_with()
+        self.assertIsInstance(application, CustomerApp)
+        await application.engine.dispose()
+
+    async def test_not_found_and_not_allowed(self):
+        """It should return 404 for an unknown URL and 405 for an unknown method"""
+        code, _, _ = await call(self.application, "GET", "/nowhere")
+        self.assertEqual(code, status.HTTP_404_NOT_FOUND)
+        code, _, data = await call(self.application, "PATCH", BASE_URL)
+        self.assertEqual(code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(data["error"], "Method not Allowed")
+
+    async def test_create_and_get(self):
+        """It should create a Customer that the Flask service can read"""
+        new = await self._create(status=True)
+        self.assertIsInstance(new["id"], str)
+        self.assertIsNotNone(Customer.find(int(new["id"])))
+        code, headers, data = await call(self.application, "GET", f"{BASE_URL}/{new['id']}")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(data, new)
+        code, _, _ = await call(
+            self.application, "GET", f"{BASE_URL}/{new['id']}", headers={"If-None-Match": headers["etag"]}
+        )
+        self.assertEqual(code, status.HTTP_304_NOT_MODIFIED)
+        code, _, _ = await call(self.application, "GET", f"{BASE_URL}/{new['id']}", headers={"If-None-Match": "*"})
+        self.assertEqual(code, status.HTTP_304_NOT_MODIFIED)
+        code, _, _ = await call(
+            self.application, "GET", f"{BASE_URL}/{new['id']}", headers={"If-None-Match": f"W/{headers['etag']}"}
+        )
+        self.assertEqual(code, status.HTTP_304_NOT_MODIFIED)
+        code, _, data = await call(self.application, "GET", f"{BASE_URL}/{new['id']}", "fields=first_name,id")
+        self.assertEqual(data, {"first_name": new["first_name"], "id": new["id"]})
+
+    async def test_create_bad_data(self):
+        """It should not create a Customer from bad data"""
+        code, _, data = await call(self.application, "POST", BASE_URL, body={"first_name": "Ann"})
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(data["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(data["error"], "Bad Request")
+        self.assertIn("last_name", data["message"])
+        code, _, _ = await call(self.application, "POST", BASE_URL, body=b"not json")
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+
+    async def test_get_not_found(self):
+        """It should not find a missing or deactivated Customer"""
+        code, _, _ = await call(self.application, "GET", f"{BASE_URL}/0")
+        self.assertEqual(code, status.HTTP_404_NOT_FOUND)
+        new = await self._create(status=False)
+        code, _, _ = await call(self.application, "GET", f"{BASE_URL}/{new['id']}")
+        self.assertEqual(code, status.HTTP_404_NOT_FOUND)
+
+    async def test_update(self):
+        """It should update a Customer unless it changed since If-Match"""
+        new = await self._create(status=True)
+        url = f"{BASE_URL}/{new['id']}"
+        _, headers, _ = await call(self.application, "GET", url)
+        code, _, data = await call(
+            self.application, "PUT", url, body=dict(new, first_name="Bo"), headers={"If-Match": headers["etag"]}
+        )
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(data["first_name"], "Bo")
+        code, _, _ = await call(self.application, "PUT", url, body=new, headers={"If-Match": headers["etag"]})
+        self.assertEqual(code, status.HTTP_412_PRECONDITION_FAILED)
+        code, _, _ = await call(self.application, "PUT", url, body=dict(new, active=False))
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+        code, _, _ = await call(self.application, "PUT", f"{BASE_URL}/0", body=new)
+        self.assertEqual(code, status.HTTP_404_NOT_FOUND)
+
+    async def test_delete(self):
+        """It should delete a Customer"""
+        new = await self._create()
+        code, _, data = await call(self.application, "DELETE", f"{BASE_URL}/{new['id']}")
+        self.assertEqual(code, status.HTTP_204_NO_CONTENT)
+        self.assertIsNone(data)
+        self.assertIsNone(Customer.find(int(new["id"])))
+
+    async def test_deactivate_and_restore(self):
+        """It should deactivate and restore a Customer"""
+        new = await self._create(status=True)
+        code, _, _ = await call(self.application, "PUT", f"{BASE_URL}/{new['id']}/deactivate")
+        self.assertEqual(code, status.HTTP_200_OK)
+        code, _, data = await call(self.application, "PUT", f"{BASE_URL}/{new['id']}/restore")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertTrue(data["active"])
+        code, _, _ = await call(self.application, "PUT", f"{BASE_URL}/0/restore")
+        self.assertEqual(code, status.HTTP_404_NOT_FOUND)
+
+    async def test_list_pages(self):
+        """It should list the Customers a page at a time"""
+        created = [await self._create(last_name="Page") for _ in range(3)]
+        code, headers, data = await call(self.application, "GET", BASE_URL, "last_name=Page&limit=2")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(data, created[:2])
+        self.assertIn('rel="next"', headers["link"])
+        cursor = re.search(r"cursor=([^&>]+)", headers["link"]).group(1)
+        code, headers, data = await call(self.application, "GET", BASE_URL, f"last_name=Page&limit=2&cursor={cursor}")
+        self.assertEqual(data, created[2:])
+        self.assertNotIn("link", headers)
+        code, _, _ = await call(self.application, "GET", BASE_URL, headers={"If-None-Match": headers["etag"]})
+        self.assertEqual(code, status.HTTP_200_OK)
+
+    async def test_list_bad_arguments(self):
+        """It should reject bad query string arguments"""
+        code, _, data = await call(self.application, "GET", BASE_URL, "limit=0")
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("limit", data["errors"])
+        code, _, data = await call(self.application, "GET", BASE_URL, "cursor=@@")
+        self.assertEqual(code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(data, {"status": 400, "error": "Bad Request", "message": "Invalid cursor '@@'."})
+
+    async def test_count(self):
+        """It should count the matching Customers"""
+        await self._create(status=True)
+        await self._create(status=False)
+        code, _, data = await call(self.application, "GET", f"{BASE_URL}/count", "active=true")
+        self.assertEqual(code, status.HTTP_200_OK)
+        self.assertEqual(data, {"count": 1, "estimated": False})
+        code, headers, data = await call(self.application, "HEAD", BASE_URL, "estimate=true")
+        self.assertEqual(headers["x-total-count"], "2")
+        self.assertIsNone(data)
+
+    async def test_concurrent_requests(self):
+        """It should serve many requests at the same time from one process"""
+        new = await self._create(status=True)
+        Customer.cache.clear()
+        results = await asyncio.gather(
+            *(call(self.application, "GET", f"{BASE_URL}/{new['id']}", "fields=id") for _ in range(50))
+        )
+        self.assertEqual({code for code, _, _ in results}, {status.HTTP_200_OK})
+
+    async def test_lifespan(self):
+        """It should close its connections on shutdown"""
+        messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await self.application({"type": "lifespan"}, receive, send)
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
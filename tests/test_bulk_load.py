@@ -0,0 +1,99 @@
+"""
+Test cases for Bulk Loading
+"""
+import io
+import re
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+from service.common import bulk_load
+from service.common.bulk_load import CopyStream, LoadError
+
+COLUMNS = ["first_name", "last_name", "address", "status"]
+
+# a field of COPY's CSV: quoted, with "" for a quote inside, or unquoted
+FIELD = re.compile(r'(?:"((?:[^"]|"")*)"|([^,\n]*))([,\n])')
+
+
+def copy_rows(text: str) -> list:
+    """Reads CSV the way COPY does, where an unquoted empty field is NULL"""
+    rows, row = [], []
+    for field in FIELD.finditer(text):
+        quoted, bare, end = field.groups()
+        row.append(quoted.replace('""', '"') if quoted is not None else bare or None)
+        if end == "\n":
+            rows.append(row)
+            row = []
+    return rows
+
+
+######################################################################
+#  B U L K   L O A D   T E S T   C A S E S
+######################################################################
+class TestBulkLoad(TestCase):
+    """Test Cases for reading and streaming Customers in bulk"""
+
+    def test_parse_bool(self):
+        """It should read the booleans a CSV file spells"""
+        self.assertTrue(bulk_load.parse_bool(" TRUE "))
+        self.assertTrue(bulk_load.parse_bool("1"))
+        self.assertFalse(bulk_load.parse_bool("no"))
+        self.assertEqual(bulk_load.parse_bool("maybe"), "maybe")
+
+    def test_read_csv(self):
+        """It should read a CSV file with a header row, a line number per record"""
+        file = io.StringIO('first_name,last_name,address,active\r\nAda,Lovelace,"12 St James\nLondon",t\r\nAl,T,B,f\r\n')
+        records = list(bulk_load.read_csv(file))
+        self.assertEqual(
+            records,
+            [
+                (3, {"first_name": "Ada", "last_name": "Lovelace", "address": "12 St James\nLondon", "active": True}),
+                (4, {"first_name": "Al", "last_name": "T", "address": "B", "active": False}),
+            ],
+        )
+
+    def test_read_ndjson(self):
+        """It should read a JSON object per line and skip blank lines"""
+        file = io.StringIO('{"first_name": "Ada"}\n\n{"first_name": "Al"}\n')
+        self.assertEqual(list(bulk_load.read_ndjson(file)), [(1, {"first_name": "Ada"}), (3, {"first_name": "Al"})])
+        with self.assertRaisesRegex(LoadError, "line 2"):
+            list(bulk_load.read_ndjson(io.StringIO('{}\n{"first_name": \n')))
+
+    def test_chunks(self):
+        """It should split rows into lists of a size"""
+        self.assertEqual(list(bulk_load.chunks(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(bulk_load.chunks([], 2)), [])
+
+    def test_copy_stream(self):
+        """It should read the rows as CSV, however little is read at a time"""
+        rows = [
+            {"first_name": "Ada", "last_name": "Lovelace", "address": 'The "Hall",\nLondon', "status": True},
+            {"first_name": "Al", "last_name": "T", "address": None, "status": False},
+        ]
+        stream = CopyStream(iter(rows), COLUMNS)
+        self.assertTrue(stream.readable())
+        text = "".join(iter(lambda: stream.read(5), ""))
+        self.assertEqual(text, '"Ada","Lovelace","The ""Hall"",\nLondon",t\n"Al","T",,f\n')
+        self.assertEqual(stream.count, 2)
+        self.assertEqual(copy_rows(text), [["Ada", "Lovelace", 'The "Hall",\nLondon', "t"], ["Al", "T", None, "f"]])
+        stream = CopyStream(rows, COLUMNS)
+        self.assertEqual(stream.read(), text)
+        self.assertEqual(stream.read(), "")
+
+    def test_copy_stream_empty_string(self):
+        """It should keep an empty string apart from NULL, as executemany does"""
+        rows = [{"first_name": "", "last_name": "T", "address": None, "status": True}]
+        self.assertEqual(copy_rows(CopyStream(rows, COLUMNS).read()), [["", "T", None, "t"]])
+
+    def test_copy_stream_is_lazy(self):
+        """It should only take the rows a read needs"""
+        rows = ({"first_name": str(n), "last_name": "L", "address": "A", "status": True} for n in range(1000))
+        stream = CopyStream(rows, COLUMNS)
+        stream.read(20)
+        self.assertEqual(stream.count, 2)
+
+    @patch("service.common.bulk_load.time.perf_counter", side_effect=[0.0, 1.0, 2.0])
+    def test_progress(self, _):
+        """It should report every so many rows"""
+        report = MagicMock()
+        self.assertEqual(list(bulk_load.progress(range(5), 2, report)), [0, 1, 2, 3, 4])
+        self.assertEqual([call.args for call in report.call_args_list], [(2, 1.0), (4, 2.0)])
@@ -0,0 +1,110 @@
+"""
+Test cases for the Cache Backends
+"""
+from unittest import TestCase
+from service.common.cache import CacheBackend, LRUCache, NullCache, create_cache
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    """A clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+######################################################################
+#  C A C H E   T E S T   C A S E S
+######################################################################
+class TestLRUCache(TestCase):
+    """Test Cases for the in-process LRU cache"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = LRUCache(maxsize=2, ttl=10, clock=self.clock)
+
+    def test_get_and_set(self):
+        """It should return what was set"""
+        self.assertIsNone(self.cache.get(1))
+        self.cache.set(1, {"id": 1})
+        self.assertEqual(self.cache.get(1), {"id": 1})
+        self.assertEqual(self.cache.stats(), {"size": 1, "maxsize": 2, "evictions": 0})
+
+    def test_evicts_least_recently_used(self):
+        """It should evict the least recently used entry when full"""
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.get(1)
+        self.cache.set(3, "three")
+        self.assertIsNone(self.cache.get(2))
+        self.assertEqual(self.cache.get(1), "one")
+        self.assertEqual(self.cache.get(3), "three")
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_expires_entries(self):
+        """It should expire entries after the TTL"""
+        self.cache.set(1, "one")
+        self.clock.now = 9.9
+        self.assertEqual(self.cache.get(1), "one")
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get(1))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_delete_and_clear(self):
+        """It should forget deleted and cleared entries"""
+        self.cache.set(1, "one")
+        self.cache.set(2, "two")
+        self.cache.delete(1)
+        self.cache.delete(99)
+        self.assertIsNone(self.cache.get(1))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get(2))
+
+    def test_zero_size_stores_nothing(self):
+        """It should not store anything when the size is zero"""
+        cache = LRUCache(maxsize=0)
+        cache.set(1, "one")
+        self.assertIsNone(cache.get(1))
+
+
+class TestCreateCache(TestCase):
+    """Test Cases for choosing a cache backend"""
+
+    def test_create_lru_cache(self):
+        """It should create the LRU cache from the configuration"""
+        cache = create_cache(
+            {
+                "CUSTOMER_CACHE_BACKEND": "service.common.cache.LRUCache",
+                "CUSTOMER_CACHE_SIZE": 5,
+                "CUSTOMER_CACHE_TTL": 1.5,
+            }
+        )
+        self.assertIsInstance(cache, LRUCache)
+        self.assertEqual(cache.maxsize, 5)
+        self.assertEqual(cache.ttl, 1.5)
+
+    def test_create_null_cache(self):
+        """It should create a backend that never caches"""
+        cache = create_cache({"CUSTOMER_CACHE_BACKEND": "service.common.cache.NullCache"})
+        self.assertIsInstance(cache, NullCache)
+        cache.set(1, "one")
+        cache.delete(1)
+        cache.clear()
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats(), {})
+
+    def test_backend_interface(self):
+        """It should make backends implement every operation"""
+        with self.assertRaisesRegex(TypeError, "abstract"):
+            CacheBackend()  # pylint: disable=abstract-class-instantiated
+
+        class GetOnly(CacheBackend):  # pylint: disable=abstract-method
+            """A backend that forgot most operations"""
+
+            def get(self, key):
+                return None
+
+        with self.assertRaisesRegex(TypeError, "delete"):
+            GetOnly()  # pylint: disable=abstract-class-instantiated
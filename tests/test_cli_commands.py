@@ -2,22 +2,119 @@
 CLI Command Extensions for Flask
 """
 import os
+import sys
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
-from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from service import create_app
+
+app = create_app({"TESTING": True})
 
 
 class TestFlaskCLI(TestCase):
     """Test Flask CLI Commands"""
 
     def setUp(self):
-        self.runner = CliRunner()
+        self.runner = app.test_cli_runner()
 
     @patch('service.common.cli_commands.db')
     def test_db_create(self, db_mock):
         """It should call the db-create command"""
         db_mock.return_value = MagicMock()
-        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
-            result = self.runner.invoke(db_create)
-            self.assertEqual(result.exit_code, 0)
+        result = self.runner.invoke(args=["db-create"])
+        self.assertEqual(result.exit_code, 0)
+
+    @patch('service.common.cli_commands.Customer')
+    @patch('service.common.cli_commands.db')
+    def test_db_migrate(self, db_mock, customer_mock):
+        """It should call the db-migrate command"""
+        customer_mock.create_indexes.return_value = ["ix_customer_address"]
+        result = self.runner.invoke(args=["db-migrate"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("ix_customer_address", result.output)
+        db_mock.create_all.assert_called_once()
+        db_mock.drop_all.assert_not_called()
+
+
+######################################################################
+#  D B - L O A D   T E S T   C A S E S
+######################################################################
+class TestDbLoad(TestCase):
+    """Test the db-load command"""
+
+    def setUp(self):
+        self.runner = app.test_cli_runner()
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.loaded = []
+        patcher = patch("service.common.cli_commands.Customer.load", side_effect=self.load)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, rows, chunk_size):  # pylint: disable=unused-argument
+        """Stands in for Customer.load and keeps the rows"""
+        self.loaded.extend(rows)
+        return len(self.loaded)
+
+    def write(self, name, text):
+        """Writes a file to load and returns its path"""
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            file.write(text)
+        return path
+
+    def test_load_files(self):
+        """It should load CSV and NDJSON files"""
+        csv_path = self.write("a.csv", 'first_name,last_name,address,active\r\nAda,Lovelace,"12 St James\nLondon",true\r\n')
+        ndjson_path = self.write("b.jsonl", '{"first_name": "Al", "last_name": "T", "address": "B", "active": false}\n')
+        result = self.runner.invoke(args=["db-load", csv_path, ndjson_path, "--progress-every", "1"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(
+            self.loaded,
+            [
+                {"first_name": "Ada", "last_name": "Lovelace", "address": "12 St James\nLondon", "status": True},
+                {"first_name": "Al", "last_name": "T", "address": "B", "status": False},
+            ],
+        )
+        self.assertIn("Loaded 1 Customers,", result.output)
+        self.assertIn("Loaded 2 Customers in", result.output)
+
+    def test_load_stdin(self):
+        """It should load from stdin in the format it is given"""
+        text = '{"first_name": "Al", "last_name": "T", "address": "B", "active": true}\n'
+        result = self.runner.invoke(args=["db-load", "--format", "ndjson", "-"], input=text)
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(self.loaded), 1)
+
+    def test_load_synthetic(self):
+        """It should load fake Customers"""
+        result = self.runner.invoke(args=["db-load", "--synthetic", "5"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(self.loaded), 5)
+        self.assertEqual(set(self.loaded[0]), {"first_name", "last_name", "address", "status"})
+
+    def test_load_synthetic_without_factories(self):
+        """It should explain that fake Customers need the tests"""
+        with patch.dict(sys.modules, {"tests.factories": None}):
+            result = self.runner.invoke(args=["db-load", "--synthetic", "5"])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn("needs the tests package", result.output)
+
+    def test_load_bad_arguments(self):
+        """It should want either files or --synthetic, with a format it knows"""
+        self.assertEqual(self.runner.invoke(args=["db-load"]).exit_code, 2)
+        path = self.write("a.csv", "first_name\n")
+        self.assertEqual(self.runner.invoke(args=["db-load", path, "--synthetic", "1"]).exit_code, 2)
+        result = self.runner.invoke(args=["db-load", path, self.write("a.txt", "")])
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn("Cannot tell the format", result.output)
+        self.assertEqual(self.loaded, [])
+
+    def test_load_bad_record(self):
+        """It should name the file and line of a bad record"""
+        path = self.write("a.csv", "first_name,last_name,address,active\nAda,Lovelace,London,maybe\n")
+        result = self.runner.invoke(args=["db-load", path])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn(f"Nothing was loaded. {path}, line 2: Invalid type for boolean", result.output)
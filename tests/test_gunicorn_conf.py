@@ -0,0 +1,166 @@
+"""
+Test cases for the Gunicorn configuration
+"""
+import gc
+import os
+import importlib.util
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+CONF_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+
+
+def load_conf():
+    """Loads gunicorn.conf.py the way gunicorn does, as a file"""
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", CONF_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # keep the variables it sets for the workers out of the other tests
+    with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ):
+        os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(directory, "metrics"))
+        spec.loader.exec_module(module)
+    return module
+
+
+######################################################################
+#  G U N I C O R N   C O N F I G U R A T I O N   T E S T   C A S E S
+######################################################################
+class TestGunicornConf(TestCase):
+    """Test Cases for sizing gunicorn to the container"""
+
+    def setUp(self):
+        self.conf = load_conf()
+        # loading the file with preload on disables the collector for the arbiter
+        gc.enable()
+        self.root = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+
+    def tearDown(self):
+        self.root.cleanup()
+
+    def _write(self, name, value):
+        """Writes a cgroup file under the fake cgroup root"""
+        path = os.path.join(self.root.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(value + "\n")
+
+    def test_cgroup_v2(self):
+        """It should read the CPU quota and memory limit of cgroup v2"""
+        self._write("cpu.max", "20000 100000")
+        self._write("memory.max", str(128 * 2**20))
+        self.assertAlmostEqual(self.conf.cpu_limit(self.root.name), 0.2)
+        self.assertEqual(self.conf.memory_limit(self.root.name), 128 * 2**20)
+
+    def test_cgroup_v2_unlimited(self):
+        """It should fall back to the CPUs of the machine when cgroup v2 has no limits"""
+        self._write("cpu.max", "max 100000")
+        self._write("memory.max", "max")
+        self.assertGreaterEqual(self.conf.cpu_limit(self.root.name), 1)
+        self.assertIsNone(self.conf.memory_limit(self.root.name))
+
+    def test_cgroup_v1(self):
+        """It should read the CPU quota and memory limit of cgroup v1"""
+        self._write("cpu/cpu.cfs_quota_us", "50000")
+        self._write("cpu/cpu.cfs_period_us", "100000")
+        self._write("memory/memory.limit_in_bytes", str(2**30))
+        self.assertAlmostEqual(self.conf.cpu_limit(self.root.name), min(0.5, os.cpu_count()))
+        self.assertEqual(self.conf.memory_limit(self.root.name), 2**30)
+
+    def test_cgroup_v1_unlimited(self):
+        """It should treat the cgroup v1 values for no limit as no limit"""
+        self._write("cpu/cpu.cfs_quota_us", "-1")
+        self._write("cpu/cpu.cfs_period_us", "100000")
+        self._write("memory/memory.limit_in_bytes", str(2**63 - 4096))
+        self.assertGreaterEqual(self.conf.cpu_limit(self.root.name), 1)
+        self.assertIsNone(self.conf.memory_limit(self.root.name))
+
+    def test_worker_count(self):
+        """It should fit the workers in both the CPU quota and the memory limit"""
+        self.assertEqual(self.conf.worker_count(0.2, 128 * 2**20, 64), 1)
+        self.assertEqual(self.conf.worker_count(4, None, 64), 4)
+        self.assertEqual(self.conf.worker_count(4.5, 512 * 2**20, 64), 4)
+        self.assertEqual(self.conf.worker_count(8, 256 * 2**20, 64), 3)
+        self.assertEqual(self.conf.worker_count(8, 32 * 2**20, 64), 1)
+
+    def test_environment_overrides(self):
+        """It should take every setting from the environment when it is there"""
+        environ = {
+            "GUNICORN_WORKERS": "3",
+            "GUNICORN_THREADS": "1",
+            "GUNICORN_KEEPALIVE": "2",
+            "GUNICORN_MAX_REQUESTS": "500",
+            "GUNICORN_BACKLOG": "64",
+        }
+        with patch.dict(os.environ, environ):
+            conf = load_conf()
+        self.assertEqual(conf.workers, 3)
+        self.assertEqual(conf.worker_class, "sync")
+        self.assertEqual(conf.keepalive, 2)
+        self.assertEqual((conf.max_requests, conf.max_requests_jitter), (500, 50))
+        self.assertEqual(conf.backlog, 64)
+
+    def test_worker_class(self):
+        """It should use gthread for threads unless a worker class is given"""
+        self.assertEqual(self.conf.worker_class, "gthread")
+        with patch.dict(os.environ, {"GUNICORN_WORKER_CLASS": "gevent"}):
+            conf = load_conf()
+        self.assertEqual(conf.worker_class, "gevent")
+        self.assertEqual(conf.threads, 1)
+
+    def test_metrics_dir(self):
+        """It should give the workers an empty directory for their metrics"""
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ("counter_999999999.db", f"counter_{os.getpid()}.db"):
+                with open(os.path.join(directory, name), "wb"):
+                    pass
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                conf = load_conf()
+            self.assertEqual(conf.METRICS_DIR, directory)
+            self.assertEqual(os.listdir(directory), [f"counter_{os.getpid()}.db"])
+            with patch("prometheus_client.multiprocess.mark_process_dead") as mark_process_dead:
+                conf.child_exit(None, MagicMock(pid=42))
+            mark_process_dead.assert_called_once_with(42, directory)
+
+    def test_preload_hooks(self):
+        """It should freeze the arbiter's objects and reset the worker after the fork"""
+        self.assertTrue(self.conf.preload_app)
+        server = MagicMock()
+        gc.disable()
+        with patch("gc.freeze") as freeze:
+            self.conf.when_ready(server)
+        freeze.assert_called_once()
+        self.assertTrue(gc.isenabled())
+        with patch("gc.freeze") as freeze, patch("service.models.Customer.after_fork") as after_fork:
+            self.conf.pre_fork(server, None)
+            self.conf.post_fork(server, None)
+        freeze.assert_called_once()
+        after_fork.assert_called_once_with(server.app.wsgi.return_value)
+
+    def test_reload(self):
+        """It should turn the collector back on after a reload loads the file again"""
+        load_conf()
+        self.assertFalse(gc.isenabled())
+        with patch("gc.freeze") as freeze:
+            self.conf.on_reload(MagicMock())
+        freeze.assert_called_once()
+        self.assertTrue(gc.isenabled())
+        # a worker forked while the collector is off still gets it back
+        gc.disable()
+        with patch("gc.freeze"), patch("service.models.Customer.after_fork"):
+            self.conf.pre_fork(MagicMock(), None)
+            self.conf.post_fork(MagicMock(), None)
+        self.assertTrue(gc.isenabled())
+
+    def test_no_preload(self):
+        """It should leave the garbage collector alone when the app isn't preloaded"""
+        gc.enable()
+        with patch.dict(os.environ, {"GUNICORN_PRELOAD": "false"}):
+            conf = load_conf()
+        self.assertFalse(conf.preload_app)
+        self.assertTrue(gc.isenabled())
+        with patch("gc.freeze") as freeze, patch("service.models.Customer.after_fork") as after_fork:
+            conf.when_ready(None)
+            conf.pre_fork(None, None)
+            conf.post_fork(None, None)
+        freeze.assert_not_called()
+        after_fork.assert_not_called()
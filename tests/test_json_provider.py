@@ -0,0 +1,95 @@
+"""
+Test cases for the JSON Provider
+"""
+import dataclasses
+import datetime
+import decimal
+import uuid
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from service.common import json_provider
+from service.common.json_provider import COMPACT, FastJSONProvider
+
+
+@dataclasses.dataclass
+class Point:
+    """A dataclass to serialize"""
+
+    left: int
+    top: int
+
+
+PAYLOADS = [
+    {"id": "1", "first_name": "Ann", "last_name": "Lee", "address": "1 Main St", "active": True},
+    [{"b": 1, "a": None}, {"z": [1.5, -2, 0.1], "y": {"nested": False}}],
+    {"name": "Zoë Ångström", "emoji": "\U0001F600"},
+    {"big": 2**70, "small": -(2**63)},
+    {"exponents": [1e16, 1e-07, 1.5e300, -2.5e-10, 1.2345678901234568e17]},
+    {"when": datetime.datetime(2023, 10, 21, 7, 28), "day": datetime.date(2023, 10, 21)},
+    {"price": decimal.Decimal("9.99"), "uuid": uuid.UUID(int=1), "point": Point(1, 2)},
+    {3: "three", 2: "two"},
+    "plain string",
+]
+
+
+def make_app(encoder="auto"):
+    """Creates an app that uses the fast provider"""
+    app = Flask(__name__)
+    app.config["JSON_ENCODER"] = encoder
+    app.json = FastJSONProvider(app)
+    return app
+
+
+######################################################################
+#  J S O N   P R O V I D E R   T E S T   C A S E S
+######################################################################
+class TestFastJSONProvider(TestCase):
+    """Test Cases for the fast JSON provider"""
+
+    def test_uses_orjson(self):
+        """It should use orjson when it is installed"""
+        self.assertTrue(make_app().json.use_orjson)
+        self.assertFalse(make_app("json").json.use_orjson)
+
+    def test_byte_identical_output(self):
+        """It should produce exactly the bytes of the standard library provider"""
+        app = make_app()
+        default = DefaultJSONProvider(app)
+        for payload in PAYLOADS:
+            for kwargs in ({"separators": COMPACT}, {}, {"indent": 2}):
+                self.assertEqual(app.json.dumps(payload, **kwargs), default.dumps(payload, **kwargs))
+        default.ensure_ascii = app.json.ensure_ascii = False
+        self.assertEqual(
+            app.json.dumps(PAYLOADS[2], separators=COMPACT),
+            default.dumps(PAYLOADS[2], separators=COMPACT),
+        )
+
+    def test_unsorted_output(self):
+        """It should keep the key order when keys are not sorted"""
+        app = make_app()
+        app.json.sort_keys = False
+        self.assertEqual(app.json.dumps({"b": 1, "a": 2}, separators=COMPACT), '{"b":1,"a":2}')
+
+    def test_unserializable(self):
+        """It should raise the same error as the standard library"""
+        app = make_app()
+        self.assertRaises(TypeError, app.json.dumps, {1, 2}, separators=COMPACT)
+
+    def test_bad_configuration(self):
+        """It should refuse an encoder it does not know or cannot load"""
+        self.assertRaises(ValueError, make_app, "ujson")
+        with patch.object(json_provider, "orjson", None):
+            self.assertRaises(RuntimeError, make_app, "orjson")
+            self.assertFalse(make_app().json.use_orjson)
+
+    def test_output_json(self):
+        """It should make flask-restx responses with the provider"""
+        app = make_app()
+        with app.app_context():
+            response = json_provider.output_json({"b": 1, "a": "x"}, 201, {"X-Test": "yes"})
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.mimetype, "application/json")
+            self.assertEqual(response.get_data(as_text=True), '{"a":"x","b":1}\n')
+            self.assertEqual(response.headers["X-Test"], "yes")
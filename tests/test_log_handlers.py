@@ -0,0 +1,145 @@
+"""
+Test cases for the Log Handlers
+"""
+import json
+import logging
+import queue
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from service.common import log_handlers, metrics
+from service.common.log_handlers import DroppingQueueHandler, JsonFormatter, SamplingFilter, parse_rates
+
+
+class ListHandler(logging.Handler):
+    """Keeps the formatted records"""
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def make_record(name="service", level=logging.INFO, msg="Customer %s", args=(1,), exc_info=None):
+    """Returns a log record"""
+    return logging.LogRecord(name, level, __file__, 1, msg, args, exc_info)
+
+
+######################################################################
+#  L O G   H A N D L E R S   T E S T   C A S E S
+######################################################################
+class TestLogHandlers(TestCase):
+    """Test Cases for the logging pipeline"""
+
+    def setUp(self):
+        self.app = Flask("service")
+        self.target = ListHandler()
+        self.gunicorn = logging.getLogger("test.gunicorn")
+        self.gunicorn.handlers = [self.target]
+        self.gunicorn.setLevel(logging.INFO)
+
+    def tearDown(self):
+        pipeline = self.app.extensions.get("log_pipeline")
+        if pipeline is not None:
+            pipeline.stop()
+
+    def test_request_id(self):
+        """It should keep a safe request id from the client and make one up otherwise"""
+        self.assertEqual(log_handlers.request_id(), "-")
+        with self.app.test_request_context("/", headers={"X-Request-ID": "abc-123"}):
+            self.assertEqual(log_handlers.request_id(), "abc-123")
+        with self.app.test_request_context("/", headers={"X-Request-ID": "bad id"}):
+            generated = log_handlers.request_id()
+            self.assertRegex(generated, r"^[0-9a-f]{32}$")
+            self.assertEqual(log_handlers.request_id(), generated)
+
+    def test_text_logging(self):
+        """It should write text with the request id on the request thread"""
+        self.app.config.update(LOG_QUEUE_SIZE=0)
+        log_handlers.init_logging(self.app, "test.gunicorn")
+        self.assertEqual(self.app.logger.handlers[0].handlers, [self.target])
+        with self.app.test_request_context("/", headers={"X-Request-ID": "abc"}):
+            self.app.logger.info("Customer %s", 7)
+        self.assertRegex(self.target.lines[-1], r"\[INFO\] \[test_log_handlers\] \[abc\] Customer 7$")
+        # gunicorn's own records have no request id
+        self.gunicorn.info("Booting worker")
+        self.assertIn("[-] Booting worker", self.target.lines[-1])
+
+    def test_json_logging_through_the_queue(self):
+        """It should write JSON from the listener thread"""
+        self.app.config.update(LOG_QUEUE_SIZE=100, LOG_FORMAT="json")
+        log_handlers.init_logging(self.app, "test.gunicorn")
+        pipeline = self.app.extensions["log_pipeline"]
+        self.assertEqual(self.app.logger.handlers[0].handlers, [pipeline.handler])
+        with self.app.test_request_context("/", headers={"X-Request-ID": "abc"}):
+            self.app.logger.info("Customer %s", 7)
+        pipeline.stop()
+        entry = json.loads(self.target.lines[-1])
+        self.assertEqual(entry["message"], "Customer 7")
+        self.assertEqual(entry["request_id"], "abc")
+        self.assertEqual((entry["level"], entry["logger"]), ("INFO", "service"))
+        # a forked child starts a listener of its own
+        pipeline.restart()
+        self.app.logger.warning("After the fork")
+        pipeline.stop()
+        self.assertEqual(json.loads(self.target.lines[-1])["message"], "After the fork")
+
+    def test_module_logger(self):
+        """It should write the records of the service modules like those of the app"""
+        self.app.config.update(LOG_FORMAT="json")
+        log_handlers.init_logging(self.app, "test.gunicorn")
+        with self.app.test_request_context("/", headers={"X-Request-ID": "abc"}):
+            logging.getLogger("flask.app").warning("Slow query")
+        entry = json.loads(self.target.lines[-1])
+        self.assertEqual((entry["message"], entry["request_id"]), ("Slow query", "abc"))
+
+    def test_init_twice(self):
+        """It should share one pipeline and leave gunicorn's handlers unfiltered"""
+        self.app.config.update(LOG_QUEUE_SIZE=100)
+        log_handlers.init_logging(self.app, "test.gunicorn")
+        other = Flask("service")
+        other.config.update(LOG_QUEUE_SIZE=100)
+        log_handlers.init_logging(other, "test.gunicorn")
+        self.assertIs(other.extensions["log_pipeline"], self.app.extensions["log_pipeline"])
+        self.assertEqual(self.target.filters, [])
+        self.assertEqual(self.app.extensions["log_pipeline"].handler.filters, [])
+
+    def test_response_header(self):
+        """It should send the request id back"""
+        log_handlers.init_logging(self.app, "test.gunicorn")
+        self.app.route("/")(lambda: "")
+        response = self.app.test_client().get("/", headers={"X-Request-ID": "abc"})
+        self.assertEqual(response.headers["X-Request-ID"], "abc")
+
+    def test_drop_when_full(self):
+        """It should drop and count the records that don't fit in the queue"""
+        handler = DroppingQueueHandler(queue.Queue(1))
+        dropped = metrics.LOG_RECORDS_DROPPED._value.get()  # pylint: disable=protected-access
+        for _ in range(3):
+            handler.handle(make_record())
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(metrics.LOG_RECORDS_DROPPED._value.get(), dropped + 2)  # pylint: disable=protected-access
+
+    def test_prepare(self):
+        """It should merge the arguments and the traceback before the record is queued"""
+        record = make_record(exc_info=(ValueError, ValueError("boom"), None))
+        prepared = DroppingQueueHandler(queue.Queue()).prepare(record)
+        self.assertEqual((prepared.msg, prepared.args, prepared.exc_info), ("Customer 1", None, None))
+        entry = json.loads(JsonFormatter().format(prepared))
+        self.assertIn("ValueError: boom", entry["exception"])
+        self.assertEqual(entry["request_id"], "-")
+
+    def test_sampling(self):
+        """It should keep a share of the INFO records of the loggers it names"""
+        sampler = SamplingFilter(parse_rates("service=0.25, sqlalchemy=0"))
+        self.assertEqual(sampler.rate("service.routes"), 0.25)
+        self.assertEqual(sampler.rate("other"), 1.0)
+        self.assertFalse(sampler.filter(make_record("sqlalchemy.engine")))
+        self.assertTrue(sampler.filter(make_record("sqlalchemy.engine", logging.WARNING)))
+        self.assertTrue(sampler.filter(make_record("other")))
+        with patch("random.random", return_value=0.1):
+            self.assertTrue(sampler.filter(make_record("service")))
+        with patch("random.random", return_value=0.5):
+            self.assertFalse(sampler.filter(make_record("service")))
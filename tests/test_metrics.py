@@ -0,0 +1,70 @@
+"""
+Test cases for the Prometheus metrics
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from service.common import metrics
+from service.common.pool import InstrumentedQueuePool
+
+# A worker that answered three reads from the cache, and has exited
+WORKER = """
+from service.common import metrics
+metrics.CACHE_HITS.inc(3)
+"""
+
+
+def sample(gauge, database: str) -> float:
+    """Returns the value of a labeled metric in this process"""
+    return gauge.labels(database)._value.get()  # pylint: disable=protected-access
+
+
+######################################################################
+#  M E T R I C S   T E S T   C A S E S
+######################################################################
+class TestMetrics(TestCase):
+    """Test Cases for the metrics"""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.engine = create_engine(f"sqlite:///{self.path}", poolclass=InstrumentedQueuePool, pool_size=2)
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_watch_pool(self):
+        """It should count the connections checked out and held open"""
+        metrics.watch_pool(self.engine, "test")
+        metrics.watch_pool(self.engine, "test")
+        checked_out = sample(metrics.POOL_CHECKED_OUT, "test")
+        connections = sample(metrics.POOL_CONNECTIONS, "test")
+        connection = self.engine.connect()
+        self.assertEqual(sample(metrics.POOL_CHECKED_OUT, "test"), checked_out + 1)
+        self.assertEqual(sample(metrics.POOL_CONNECTIONS, "test"), connections + 1)
+        connection.close()
+        self.assertEqual(sample(metrics.POOL_CHECKED_OUT, "test"), checked_out)
+        # dispose() keeps the listeners on the pool that replaces the old one
+        self.engine.dispose()
+        self.assertEqual(sample(metrics.POOL_CONNECTIONS, "test"), connections)
+        with self.engine.connect():
+            self.assertEqual(sample(metrics.POOL_CHECKED_OUT, "test"), checked_out + 1)
+
+    def test_render_multiprocess(self):
+        """It should add up the metrics the workers wrote to PROMETHEUS_MULTIPROC_DIR"""
+        with tempfile.TemporaryDirectory() as directory:
+            environ = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+            for _ in range(2):
+                subprocess.run(
+                    [sys.executable, "-c", WORKER], env=environ, check=True
+                )
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                data, content_type = metrics.render()
+        self.assertTrue(content_type.startswith("text/plain"))
+        self.assertIn(b'customer_cache_hits_total 6.0', data)
+        self.assertIn(b'http_requests_in_flight 0.0', data)
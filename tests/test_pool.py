@@ -0,0 +1,89 @@
+"""
+Test cases for the Connection Pool statistics
+"""
+import os
+import tempfile
+from unittest import TestCase
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import NullPool
+from service import create_app
+from service.common.pool import InstrumentedQueuePool, engine_options, pool_stats
+from service.models import db
+
+
+######################################################################
+#  P O O L   T E S T   C A S E S
+######################################################################
+class TestInstrumentedQueuePool(TestCase):
+    """Test Cases for the instrumented pool"""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.engine = create_engine(
+            f"sqlite:///{self.path}",
+            poolclass=InstrumentedQueuePool,
+            pool_size=1,
+            max_overflow=0,
+            pool_timeout=0.05,
+        )
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_checkout_stats(self):
+        """It should report checkouts and the connections in use"""
+        connection = self.engine.connect()
+        stats = pool_stats(self.engine)
+        self.assertEqual(stats["pid"], os.getpid())
+        self.assertEqual(stats["pool"], "InstrumentedQueuePool")
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["checkedout"], 1)
+        self.assertEqual(stats["checkouts"], 1)
+        connection.close()
+        stats = pool_stats(self.engine)
+        self.assertEqual(stats["checkedout"], 0)
+        self.assertEqual(stats["checkedin"], 1)
+
+    def test_timeout_stats(self):
+        """It should count checkouts that time out waiting for a connection"""
+        connection = self.engine.connect()
+        self.assertRaises(exc.TimeoutError, self.engine.connect)
+        connection.close()
+        stats = pool_stats(self.engine)
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["wait_max_ms"], 50)
+        self.assertGreater(stats["wait_avg_ms"], 0)
+
+    def test_other_pools(self):
+        """It should report what it can about other pool classes"""
+        engine = create_engine(f"sqlite:///{self.path}", poolclass=NullPool)
+        stats = pool_stats(engine)
+        self.assertEqual(stats["pool"], "NullPool")
+        self.assertNotIn("checkouts", stats)
+        self.assertEqual(InstrumentedQueuePool(lambda: None).wait_stats()["wait_avg_ms"], 0.0)
+
+
+######################################################################
+#  E N G I N E   O P T I O N S   T E S T   C A S E S
+######################################################################
+class TestEngineOptions(TestCase):
+    """Test Cases for choosing the pool from the database URI"""
+
+    def test_engine_options(self):
+        """It should add the pool for a database that can be pooled, and only for one"""
+        config = {"SQLALCHEMY_ENGINE_OPTIONS": {"pool_recycle": 5, "pool_size": 99}, "DB_POOL_SIZE": 2}
+        options = engine_options("postgresql://db/customers", config)
+        self.assertEqual(options["poolclass"], InstrumentedQueuePool)
+        self.assertEqual((options["pool_size"], options["pool_recycle"]), (2, 5))
+        self.assertEqual(engine_options("sqlite:///customers.db", config)["pool_size"], 2)
+        self.assertEqual(engine_options("sqlite://", config), {"pool_recycle": 5})
+        self.assertEqual(engine_options("sqlite:///:memory:", config), {"pool_recycle": 5})
+
+    def test_in_memory_app(self):
+        """It should create an app on an in-memory database whatever DATABASE_URI is"""
+        app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite://"})
+        with app.app_context():
+            self.assertNotIsInstance(db.engine.pool, InstrumentedQueuePool)
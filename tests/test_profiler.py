@@ -0,0 +1,102 @@
+"""
+Test cases for the Request Profiler
+"""
+import logging
+import os
+import pstats
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from service import create_app
+from service.common import profiler
+from service.common.profiler import SamplingProfiler
+
+directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+app = create_app({"TESTING": True, "PROFILE_DIR": directory.name, "PROFILE_TOKEN": "secret"})
+
+
+######################################################################
+#  P R O F I L E R   T E S T   C A S E S
+######################################################################
+class TestProfiler(TestCase):
+    """Test Cases for profiling requests"""
+
+    @classmethod
+    def setUpClass(cls):
+        """Run once before all tests"""
+        app.logger.setLevel(logging.CRITICAL)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Run once after all tests"""
+        directory.cleanup()
+
+    def setUp(self):
+        self.client = app.test_client()
+        for name in os.listdir(directory.name):
+            os.remove(os.path.join(directory.name, name))
+
+    def tearDown(self):
+        app.config.update(PROFILE_FORMAT="pstats", PROFILE_SAMPLE_RATE=0)
+
+    def test_not_configured(self):
+        """It should not add any hooks when profiling is not configured"""
+        plain = create_app({"TESTING": True, "PROFILE_TOKEN": "secret"})
+        self.assertNotIn(profiler.start_profile, plain.before_request_funcs.get(None, []))
+        self.assertIn(profiler.start_profile, app.before_request_funcs[None])
+
+    def test_profile_with_token(self):
+        """It should write a pstats file for a request with the token"""
+        response = self.client.get("/api/customers", headers={"X-Profile-Token": "secret"})
+        self.assertEqual(response.status_code, 200)
+        names = os.listdir(directory.name)
+        self.assertEqual(len(names), 1)
+        self.assertRegex(names[0], rf"^\d+-{os.getpid()}-GET-api_customers\.pstats$")
+        stats = pstats.Stats(os.path.join(directory.name, names[0]))
+        self.assertIn("get", {function for _, _, function in stats.stats})
+
+    def test_no_profile(self):
+        """It should not profile a request with the wrong token or no token"""
+        self.client.get("/api/customers", headers={"X-Profile-Token": "guess"})
+        self.client.get("/api/customers")
+        self.assertEqual(os.listdir(directory.name), [])
+
+    def test_sample_rate(self):
+        """It should profile a sample of the requests as collapsed stacks"""
+        app.config.update(PROFILE_FORMAT="collapsed", PROFILE_SAMPLE_RATE=1.0)
+        self.client.get("/health")
+        names = os.listdir(directory.name)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].endswith("-GET-health.collapsed"))
+
+    def test_one_at_a_time(self):
+        """It should not profile a request while another one is profiled"""
+        with profiler._busy:  # pylint: disable=protected-access
+            self.client.get("/health", headers={"X-Profile-Token": "secret"})
+        self.assertEqual(os.listdir(directory.name), [])
+
+    def test_profiler_in_use(self):
+        """It should serve the request when the profiler can't start"""
+        with patch.object(profiler.TracingProfiler, "start", side_effect=ValueError("in use")):
+            response = self.client.get("/health", headers={"X-Profile-Token": "secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(os.listdir(directory.name), [])
+        self.assertFalse(profiler._busy.locked())  # pylint: disable=protected-access
+
+    def test_sampling_profiler(self):
+        """It should sample the stack of the thread it watches"""
+        sampler = SamplingProfiler(threading.get_ident(), 0.001)
+        sampler.start()
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            pass
+        sampler.stop()
+        self.assertTrue(sampler.stacks)
+        stack = next(iter(sampler.stacks))
+        self.assertIn("test_sampling_profiler (test_profiler.py:", stack.split(";")[-1])
+        path = os.path.join(directory.name, "test.collapsed")
+        sampler.write(path)
+        with open(path, encoding="utf-8") as file:
+            self.assertRegex(file.readline(), r" \d+\n$")
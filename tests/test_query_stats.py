@@ -0,0 +1,85 @@
+"""
+Test cases for the Query Statistics
+"""
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from sqlalchemy import create_engine, text
+from service.common import query_stats
+from service.common.query_stats import RequestQueries, parameter_shape
+
+
+######################################################################
+#  Q U E R Y   S T A T I S T I C S   T E S T   C A S E S
+######################################################################
+class TestQueryStats(TestCase):
+    """Test Cases for timing SQL statements"""
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.engine = create_engine(f"sqlite:///{self.path}")
+        self.app = Flask(__name__)
+        query_stats.init_app(self.app)
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_parameter_shape(self):
+        """It should describe the parameters by their types only"""
+        self.assertEqual(parameter_shape({"id": 1, "name": "Ann"}), "{id: int, name: str}")
+        self.assertEqual(parameter_shape((1, 2, 3, "a", None)), "(int x 3, str, NoneType)")
+        self.assertEqual(parameter_shape([(1, "a"), (2, "b")], executemany=True), "2 x (int, str)")
+        self.assertEqual(parameter_shape([], executemany=True), "0 x ()")
+        self.assertEqual(parameter_shape(None), "NoneType")
+
+    def test_request_queries(self):
+        """It should count the statements and find the ones that repeat"""
+        queries = RequestQueries()
+        for _ in range(3):
+            queries.record("SELECT 1", 0.001)
+        queries.record("SELECT 2", 0.002)
+        self.assertEqual(queries.count, 4)
+        self.assertEqual(queries.repeated(3), [(3, "SELECT 1")])
+        self.assertEqual(queries.repeated(0), [])
+        self.assertEqual(queries.server_timing(), 'db;dur=5.00;desc="4 queries"')
+
+    def test_slow_query_log(self):
+        """It should log the statements slower than the threshold"""
+        query_stats.watch_engine(self.engine, 0)
+        query_stats.watch_engine(self.engine, 10)
+        with self.assertLogs("flask.app", "WARNING") as logs, self.engine.connect() as connection:
+            connection.execute(text("SELECT :a,\n :b"), {"a": 1, "b": "x"})
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn("with parameters (int, str): SELECT ?, ?", logs.output[0])
+
+    def test_slow_query_log_off(self):
+        """It should not log anything when the threshold is negative"""
+        query_stats.watch_engine(self.engine, -1)
+        with patch.object(query_stats.logger, "warning") as warning, self.engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        warning.assert_not_called()
+
+    def test_request(self):
+        """It should report the statements of a request and flag the repeats"""
+        query_stats.watch_engine(self.engine, -1)
+
+        @self.app.route("/")
+        def index():  # pylint: disable=unused-variable
+            with self.engine.connect() as connection:
+                for customer_id in range(5):
+                    connection.execute(text("SELECT :id"), {"id": customer_id})
+            return ""
+
+        with self.assertLogs("flask.app", "WARNING") as logs:
+            response = self.app.test_client().get("/")
+        self.assertRegex(response.headers["Server-Timing"], r'^db;dur=\d+\.\d\d;desc="5 queries"$')
+        self.assertEqual(logs.output, ["WARNING:flask.app:Possible N+1 query, GET / ran this 5 times: SELECT ?"])
+        self.app.config.update(SERVER_TIMING=False, REPEATED_QUERY_LIMIT=6)
+        with patch.object(query_stats.logger, "warning") as warning:
+            response = self.app.test_client().get("/")
+        self.assertNotIn("Server-Timing", response.headers)
+        warning.assert_not_called()
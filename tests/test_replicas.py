@@ -0,0 +1,110 @@
+"""
+Test cases for the Read Replica router
+
+SQLite files stand in for the replicas
+"""
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from service.models import db
+from service.common.replicas import ReplicaRouter, engine_options
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    """A clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def replica_engine():
+    """Returns an engine for a new SQLite file with the customer table"""
+    handle, path = tempfile.mkstemp(suffix=".db")
+    os.close(handle)
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    return engine
+
+
+def remove_engine(engine):
+    """Closes the engine and removes its SQLite file"""
+    engine.dispose()
+    os.remove(engine.url.database)
+
+
+######################################################################
+#  R O U T E R   T E S T   C A S E S
+######################################################################
+class TestReplicaRouter(TestCase):
+    """Test Cases for choosing a replica"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.engines = [replica_engine(), replica_engine()]
+        self.down = create_engine("sqlite:////nonexistent/directory/replica.db")
+
+    def tearDown(self):
+        for engine in self.engines:
+            remove_engine(engine)
+
+    def test_round_robin(self):
+        """It should take turns between the replicas"""
+        router = ReplicaRouter(self.engines, clock=self.clock)
+        chosen = [router.choose() for _ in range(4)]
+        self.assertEqual(chosen, self.engines + self.engines)
+
+    def test_skip_unhealthy(self):
+        """It should skip a replica that fails its health check"""
+        router = ReplicaRouter([self.down, self.engines[0]], clock=self.clock)
+        self.assertEqual(router.choose(), self.engines[0])
+        self.assertEqual(router.choose(), self.engines[0])
+        self.assertFalse(router.is_healthy(0))
+
+    def test_none_healthy(self):
+        """It should return None when every replica is down"""
+        router = ReplicaRouter([self.down], clock=self.clock)
+        self.assertIsNone(router.choose())
+        self.assertIsNone(ReplicaRouter([]).choose())
+
+    def test_check_again(self):
+        """It should check a replica again after the interval"""
+        router = ReplicaRouter(self.engines[:1], check_interval=10, clock=self.clock)
+        self.assertTrue(router.is_healthy(0))
+        router.mark_down(self.engines[0])
+        self.assertIsNone(router.choose())
+        self.clock.now = 10
+        self.assertEqual(router.choose(), self.engines[0])
+
+    def test_one_check_at_a_time(self):
+        """It should use the last result while another thread checks the replica"""
+        router = ReplicaRouter([self.down], clock=self.clock)
+        with patch.object(ReplicaRouter, "_ping", return_value=False) as ping:
+            with router._checking[0]:  # pylint: disable=protected-access
+                self.assertTrue(router.is_healthy(0))
+            ping.assert_not_called()
+            self.assertFalse(router.is_healthy(0))
+            ping.assert_called_once_with(self.down)
+
+    def test_connect_timeout(self):
+        """It should give PostgreSQL replicas a connect timeout"""
+        options = {"pool_size": 5, "connect_args": {"application_name": "customers"}}
+        self.assertEqual(
+            engine_options("postgresql://db/replica", options, 3),
+            {"pool_size": 5, "connect_args": {"connect_timeout": 3, "application_name": "customers"}},
+        )
+        self.assertEqual(engine_options("sqlite://", options, 3), options)
+
+    def test_from_config(self):
+        """It should only create a router when replicas are configured"""
+        self.assertIsNone(ReplicaRouter.from_config({"DATABASE_REPLICA_URIS": []}))
+        router = ReplicaRouter.from_config(
+            {"DATABASE_REPLICA_URIS": ["sqlite://"], "REPLICA_CHECK_INTERVAL": 5}
+        )
+        self.assertEqual(len(router.engines), 1)
+        self.assertEqual(router.check_interval, 5)
+        router.dispose()